@@ -0,0 +1,51 @@
+from argparse import Namespace
+
+import pytest
+
+import benchmark
+import server
+
+
+def _args(**overrides):
+    values = dict(time_scale=0.005, latency=0.8, failure_rate=0.0, timeout_rate=0.0, seed=0, parallel=4, cycles=2,
+                  timeout=None)
+    values.update(overrides)
+    return Namespace(**values)
+
+
+def test_run_size_drives_the_scheduler_and_restores_the_server_globals():
+    originals = {name: getattr(server, name) for name in
+                 ('remote_transport', 'computer_states', 'target_labs', 'publisher', 'scheduler', 'HOST_DEADLINE')}
+
+    result = benchmark.run_size(8, _args())
+
+    assert result['failed'] == 0
+    assert result['collections_per_cycle'] >= 8  # CPU e memória vencem duas vezes por ciclo
+    assert result['api_calls'] >= 1
+    assert all(getattr(server, name) is value for name, value in originals.items())
+
+
+def test_run_size_fails_when_the_scheduler_thread_dies(monkeypatch):
+    build_scheduler = server.build_scheduler
+
+    def dead_scheduler(*args, **kwargs):
+        scheduler = build_scheduler(*args, **kwargs)
+        scheduler.run = lambda: None  # A thread do agendador termina sem coletar nada
+        return scheduler
+
+    monkeypatch.setattr(server, 'build_scheduler', dead_scheduler)
+
+    with pytest.raises(RuntimeError, match='agendador parou'):
+        benchmark.run_size(8, _args())
+
+
+def test_run_size_fails_when_the_time_budget_runs_out():
+    with pytest.raises(RuntimeError, match='tempo esgotado'):
+        benchmark.run_size(8, _args(latency=50, timeout=1))
+
+
+def test_default_time_budget_covers_the_worst_case_sweep():
+    args = _args(parallel=32, cycles=3)
+
+    assert benchmark.time_budget(100, args) == 4 * server.HOST_DEADLINE + 5 * server.MONITOR_INTERVAL
+    assert benchmark.time_budget(100, _args(timeout=30)) == 30
@@ -0,0 +1,80 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import server
+
+METRICS = ('processes', 'idle_time', 'cpu_usage', 'mem_usage')
+CHECKED_AT = datetime(2026, 3, 10, 8, 0)
+PROCESS = {'Id': 4, 'ProcessName': 'explorer', 'UserName': 'CEFETES\\aluno'}
+
+
+class FakeTransport:
+    """Devolve a saída configurada por máquina e guarda os comandos recebidos."""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.commands = []
+
+    def run(self, host, command, args=(), cancelled=None):
+        self.commands.append(command)
+        return self.outputs[host]
+
+
+def _json(document):
+    return json.dumps(document).encode('utf-8'), b'', 0
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    transport = FakeTransport({
+        'PC-OK': _json({'processes': [PROCESS], 'idle_time': 12, 'cpu_usage': 40, 'mem_usage': 60}),
+        # cpu_usage nulo, processes como objeto único (ConvertTo-Json de um só item) e idle_time ausente
+        'PC-PARCIAL': _json({'processes': PROCESS, 'cpu_usage': None, 'mem_usage': 55}),
+        'PC-SEM-USUARIO': _json({'processes': [PROCESS], 'idle_time': 'NoActiveSession', 'cpu_usage': 3, 'mem_usage': 20}),
+        'PC-LIXO': (b'WARNING: perfil corrompido', b'', 0),
+        'PC-ERRO': (b'', b'Acesso negado', 1),
+    })
+    monkeypatch.setattr(server, 'remote_transport', transport)
+    return transport
+
+
+def test_one_remote_command_per_host_with_every_metric(transport):
+    server.get_remote_metrics('PC-OK', METRICS)
+
+    assert len(transport.commands) == 1
+    script = server.build_probe_script(METRICS)
+    assert all(f"$r['{name}']" in script for name in METRICS)
+    assert server.build_probe_script(METRICS) is script
+
+
+def test_partial_failures_map_to_the_per_field_failure_values(transport):
+    assert server.get_remote_metrics('PC-OK', METRICS) == {
+        'processes': [PROCESS], 'idle_time': 12, 'cpu_usage': 40, 'mem_usage': 60, 'reachable': True}
+    assert server.get_remote_metrics('PC-PARCIAL', METRICS) == {
+        'processes': [PROCESS], 'idle_time': None, 'cpu_usage': 'N/A', 'mem_usage': 55, 'reachable': True}
+    assert server.get_remote_metrics('PC-SEM-USUARIO', METRICS)['idle_time'] == "Nenhum usuário logado"
+
+
+@pytest.mark.parametrize('host', ['PC-LIXO', 'PC-ERRO'])
+def test_unusable_output_marks_the_host_unreachable(transport, host):
+    assert server.get_remote_metrics(host, METRICS) == {
+        'processes': [], 'idle_time': None, 'cpu_usage': 'N/A', 'mem_usage': 'N/A', 'reachable': False}
+
+
+def test_sheet_rows_reflect_status_and_missing_fields(transport, monkeypatch):
+    monkeypatch.setattr(server, 'ENABLED_METRICS', METRICS)
+    states = {host: {**server.get_remote_metrics(host, METRICS), 'lab': 'CTI'}
+              for host in ('PC-OK', 'PC-PARCIAL', 'PC-SEM-USUARIO', 'PC-LIXO')}
+
+    header, *rows = server.build_sheet_table(states, CHECKED_AT)
+
+    assert header[:3] == ["Laboratório", "Máquina", "Status"]
+    timestamp = "2026-03-10 08:00:00"
+    assert rows == [
+        ['CTI', 'PC-LIXO', 'Falha na Coleta', 'N/A', 'N/A', timestamp, 'N/A', "Conexão falhou."],
+        ['CTI', 'PC-OK', 'OK', '40', '60', timestamp, '12 min', ''],
+        ['CTI', 'PC-PARCIAL', 'Parcial', 'N/A', '55', timestamp, 'N/A', "Dados indisponíveis: CPU, Ociosidade."],
+        ['CTI', 'PC-SEM-USUARIO', 'OK', '3', '20', timestamp, "Nenhum usuário logado", ''],
+    ]
@@ -0,0 +1,135 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from history import HistoryStore
+from sinks import Snapshot
+
+
+def _snapshot(ts, **states):
+    return Snapshot(datetime.fromtimestamp(ts), states)
+
+
+def _state(lab, processes):
+    return {'lab': lab, 'reachable': True, 'cpu_usage': 10, 'mem_usage': 20, 'idle_time': 5,
+            'processes': [{'Id': pid, 'ProcessName': name, 'UserName': 'aluno'} for pid, name in processes]}
+
+
+def test_rolled_back_write_leaves_caches_untouched_and_retry_succeeds(tmp_path):
+    store = HistoryStore(str(tmp_path / 'historico.db'), maintenance_interval=float('inf'))
+    failing = _snapshot(1_700_000_000, PCX=_state('LABX', [(1, 'chrome')]))
+
+    # Falha real do SQLite no último comando da transação, depois de todos os nomes serem inseridos
+    store._conn.execute("""CREATE TEMP TRIGGER falha BEFORE INSERT ON process_snapshots
+                           BEGIN SELECT RAISE(ABORT, 'disco cheio'); END""")
+    with pytest.raises(sqlite3.DatabaseError):
+        store.write(failing)
+    store._conn.execute("DROP TRIGGER falha")
+
+    assert store._name_ids == {}
+    assert store._host_labs == {}
+    assert store._last_processes == {}
+
+    store.write(_snapshot(1_700_000_060, PCY=_state('LABY', [(2, 'word')])))
+    store.write(failing)  # Repetição feita pelo SinkPipeline
+
+    assert len(set(store._name_ids.values())) == len(store._name_ids)
+    assert store._name_ids == dict(store._conn.execute("SELECT name, id FROM names"))
+    assert [s[0] for s in store.host_samples('PCY', datetime.fromtimestamp(0), datetime.now())] == \
+        [datetime.fromtimestamp(1_700_000_060)]
+    assert [s[0] for s in store.host_samples('PCX', datetime.fromtimestamp(0), datetime.now())] == \
+        [datetime.fromtimestamp(1_700_000_000)]
+    assert store.processes_at('PCX', datetime.fromtimestamp(1_700_000_000)) == \
+        [{'Id': 1, 'ProcessName': 'chrome', 'UserName': 'aluno'}]
+    labs = dict(store._conn.execute(
+        "SELECT h.name, l.name FROM hosts JOIN names h ON h.id = hosts.id JOIN names l ON l.id = hosts.lab"))
+    assert labs == {'PCX': 'LABX', 'PCY': 'LABY'}
+
+
+def test_process_changes_are_stored_as_deltas(tmp_path):
+    store = HistoryStore(str(tmp_path / 'historico.db'), maintenance_interval=float('inf'))
+    store.write(_snapshot(1_700_000_000, PC1=_state('LAB', [(1, 'chrome'), (2, 'word')])))
+    store.write(_snapshot(1_700_000_060, PC1=_state('LAB', [(1, 'chrome'), (3, 'excel')])))
+
+    keyframes = [k for (k,) in store._conn.execute("SELECT keyframe FROM process_snapshots ORDER BY ts")]
+    assert keyframes == [1, 0]
+    assert store.processes_at('PC1', datetime.fromtimestamp(1_700_000_060)) == [
+        {'Id': 1, 'ProcessName': 'chrome', 'UserName': 'aluno'},
+        {'Id': 3, 'ProcessName': 'excel', 'UserName': 'aluno'},
+    ]
+
+
+# Início de uma hora local cheia, longe da meia-noite, para que todas as amostras caiam no mesmo dia
+START = int(datetime(2026, 3, 10, 8, 0).timestamp())
+HOUR = 3600
+
+
+def _fill(store, hours, **extra_state):
+    """Uma amostra por minuto: PC1 (LAB1) ocioso, PC2 (LAB1) em uso e PC3 (LAB2) sem usuário logado.
+    A lista de processos de PC1 muda a cada amostra."""
+    for minute in range(hours * 60):
+        pc1 = _state('LAB1', [(1, 'explorer'), (100 + minute, f'job{minute}')])
+        pc1['idle_time'] = 30
+        pc3 = {'lab': 'LAB2', 'reachable': True, 'cpu_usage': 1, 'mem_usage': 30, 'idle_time': "Nenhum usuário logado"}
+        store.write(_snapshot(START + minute * 60, PC1=pc1, PC2=_state('LAB1', []), PC3=pc3))
+
+
+def _day():
+    return datetime.fromtimestamp(START).strftime('%Y-%m-%d')
+
+
+def test_idle_hours_use_hourly_rollups_and_five_minute_rollups_after_the_hourly_watermark(tmp_path):
+    store = HistoryStore(str(tmp_path / 'historico.db'), maintenance_interval=float('inf'), rollup_grace=120)
+    _fill(store, 3)
+    window = (datetime.fromtimestamp(START), datetime.fromtimestamp(START + 3 * HOUR))
+
+    store.run_maintenance(now=START + 2 * HOUR + 30 * 60 + 120)
+    assert store._watermark(300) == START + 2 * HOUR + 30 * 60
+    assert store._watermark(HOUR) == START + 2 * HOUR
+    # 2 h pelos agregados horários + 30 min pelos de 5 minutos, sem contar as mesmas horas duas vezes
+    assert store.idle_hours_per_lab_per_day(*window) == [('LAB1', _day(), 2.5), ('LAB2', _day(), 2.5)]
+
+    store.run_maintenance(now=START + 3 * HOUR + 120)
+    assert store._watermark(300) == store._watermark(HOUR) == START + 3 * HOUR
+    assert store.idle_hours_per_lab_per_day(*window) == [('LAB1', _day(), 3.0), ('LAB2', _day(), 3.0)]
+
+    hourly = store._conn.execute(
+        "SELECT samples, idle_samples, cpu_sum, cpu_n FROM rollups WHERE level = ? AND host = ? ORDER BY bucket",
+        (HOUR, store._name_ids['PC1'])).fetchall()
+    assert hourly == [(60, 60, 600, 60)] * 3
+
+
+def test_maintenance_is_incremental(tmp_path):
+    store = HistoryStore(str(tmp_path / 'historico.db'), maintenance_interval=float('inf'), rollup_grace=120)
+    _fill(store, 2)
+    store.run_maintenance(now=START + HOUR + 120)
+    store.run_maintenance(now=START + HOUR + 120)  # Repetir não agrega de novo
+    store.run_maintenance(now=START + 2 * HOUR + 120)
+
+    counts = store._conn.execute(
+        "SELECT level, SUM(samples) FROM rollups WHERE host = ? GROUP BY level", (store._name_ids['PC1'],)).fetchall()
+    assert counts == [(300, 120), (HOUR, 120)]
+
+
+def test_retention_keeps_the_last_keyframe_before_the_cutoff(tmp_path):
+    store = HistoryStore(str(tmp_path / 'historico.db'), maintenance_interval=float('inf'), rollup_grace=120,
+                         keyframe_every=30, raw_retention=HOUR, five_min_retention=2 * HOUR, hourly_retention=30 * 86400)
+    _fill(store, 3)
+    now = START + 3 * HOUR + 120
+    store.run_maintenance(now=now)
+
+    raw_cutoff = now - HOUR
+    assert store._conn.execute("SELECT MIN(ts) FROM samples").fetchone()[0] >= raw_cutoff
+    # Keyframes a cada 30 amostras: o último antes do corte é o de START + 2 h, mantido com os deltas seguintes
+    pc1 = store._name_ids['PC1']
+    assert store._conn.execute("SELECT MIN(ts), keyframe FROM process_snapshots WHERE host = ?", (pc1,)).fetchone() == \
+        (START + 2 * HOUR, 1)
+    minute = 2 * 60 + 10
+    assert store.processes_at('PC1', datetime.fromtimestamp(START + minute * 60)) == [
+        {'Id': 1, 'ProcessName': 'explorer', 'UserName': 'aluno'},
+        {'Id': 100 + minute, 'ProcessName': f'job{minute}', 'UserName': 'aluno'},
+    ]
+
+    assert store._conn.execute("SELECT MIN(bucket) FROM rollups WHERE level = 300").fetchone()[0] >= now - 2 * HOUR
+    assert store._conn.execute("SELECT MIN(bucket) FROM rollups WHERE level = ?", (HOUR,)).fetchone()[0] == START
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+
+from inventory import Inventory, StaticDirectoryBackend
+
+OU = "OU=LAB1,DC=teste,DC=local"
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class RecordingBackend(StaticDirectoryBackend):
+    """Diretório em memória que registra as consultas e pode simular o AD fora do ar."""
+
+    def __init__(self, ous):
+        super().__init__(ous)
+        self.calls = []
+        self.down = False
+
+    def fetch(self, ou_dn, changed_since=None):
+        self.calls.append(changed_since)
+        if self.down:
+            raise ConnectionError("AD indisponível")
+        return super().fetch(ou_dn, changed_since)
+
+
+def _inventory(backend, **options):
+    inventory = Inventory(backend, {OU: 'LAB1'}, **options)
+    inventory.refresh()
+    return inventory
+
+
+def test_incremental_refresh_merges_changes_and_full_refresh_drops_removed_hosts():
+    backend = RecordingBackend({OU: {'PC1': T0, 'PC2': T0}})
+    inventory = _inventory(backend, full_refresh_interval=3600, overlap=60)
+    assert inventory.hosts() == {'PC1': 'LAB1', 'PC2': 'LAB1'}
+
+    backend.ous[OU]['PC3'] = T0 + timedelta(hours=1)
+    del backend.ous[OU]['PC1']
+    inventory.refresh()
+    assert backend.calls[-1] == T0 - timedelta(seconds=60)
+    assert inventory.hosts() == {'PC1': 'LAB1', 'PC2': 'LAB1', 'PC3': 'LAB1'}  # Remoções só na leitura completa
+
+    inventory.full_refresh_interval = 0
+    inventory.refresh()
+    assert backend.calls[-1] is None
+    assert inventory.hosts() == {'PC2': 'LAB1', 'PC3': 'LAB1'}
+
+
+def test_directory_failure_keeps_the_last_inventory():
+    backend = RecordingBackend({OU: {'PC1': T0}})
+    inventory = _inventory(backend)
+    backend.down = True
+    inventory.full_refresh_interval = 0
+
+    inventory.refresh()
+
+    assert inventory.hosts() == {'PC1': 'LAB1'}
+
+
+def test_cached_inventory_is_used_when_the_directory_is_down_at_startup(tmp_path):
+    cache_path = str(tmp_path / 'inventario.json')
+    _inventory(RecordingBackend({OU: {'PC1': T0, 'PC2': T0 + timedelta(minutes=5)}}), cache_path=cache_path)
+
+    backend = RecordingBackend({})
+    backend.down = True
+    restarted = _inventory(backend, cache_path=cache_path)
+
+    assert restarted.hosts() == {'PC1': 'LAB1', 'PC2': 'LAB1'}
+    assert backend.calls == [None]  # A primeira leitura após reiniciar é completa
+    backend.down = False
+    backend.ous[OU] = {'PC2': T0 + timedelta(minutes=5)}
+    restarted.refresh()
+    assert restarted.hosts() == {'PC2': 'LAB1'}
+
+
+def test_empty_ou_is_accepted_only_after_consecutive_empty_full_reads():
+    backend = RecordingBackend({OU: {'PC1': T0}})
+    inventory = _inventory(backend, full_refresh_interval=0, empty_reads_to_accept=3)
+    backend.ous[OU] = {}
+
+    inventory.refresh()
+    inventory.refresh()
+    assert inventory.hosts() == {'PC1': 'LAB1'}
+
+    inventory.refresh()
+    assert inventory.hosts() == {}
+
+
+def test_non_empty_read_resets_the_empty_count():
+    backend = RecordingBackend({OU: {'PC1': T0}})
+    inventory = _inventory(backend, full_refresh_interval=0, empty_reads_to_accept=2)
+
+    backend.ous[OU] = {}
+    inventory.refresh()
+    backend.ous[OU] = {'PC1': T0}
+    inventory.refresh()
+    backend.ous[OU] = {}
+    inventory.refresh()
+
+    assert inventory.hosts() == {'PC1': 'LAB1'}
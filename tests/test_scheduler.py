@@ -0,0 +1,77 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scheduler import AdaptiveScheduler
+
+
+class _Recorder:
+    """collect falso: 'slow' demora mais que o prazo; as demais respondem na hora."""
+
+    def __init__(self, slow_seconds):
+        self.slow_seconds = slow_seconds
+        self.lock = threading.Lock()
+        self.active = {}
+        self.max_active = 0
+        self.overlaps = []
+        self.calls = []
+
+    def collect(self, host, cancelled, metrics):
+        with self.lock:
+            if self.active.get(host):
+                self.overlaps.append(host)
+            self.active[host] = self.active.get(host, 0) + 1
+            self.max_active = max(self.max_active, sum(self.active.values()))
+            self.calls.append((host, time.monotonic()))
+        try:
+            time.sleep(self.slow_seconds if host == 'slow' else 0.01)
+            return {'reachable': True, 'cpu_usage': 1}
+        finally:
+            with self.lock:
+                self.active[host] -= 1
+
+
+def _run(scheduler, seconds):
+    thread = threading.Thread(target=scheduler.run)
+    thread.start()
+    time.sleep(seconds)
+    scheduler.stop()
+    thread.join()
+
+
+def test_abandoned_collection_keeps_its_slot_until_the_thread_finishes():
+    recorder = _Recorder(slow_seconds=0.6)
+    results = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = AdaptiveScheduler(
+            executor, recorder.collect, lambda host, result: results.append((host, result)),
+            {'cpu_usage': 0.1}, max_parallel=2, host_deadline=0.2, batch_window=0,
+            backoff_base=0.05, backoff_max=0.05)
+        scheduler.set_hosts(['slow', 'a', 'b'])
+        _run(scheduler, 1.5)
+
+    assert recorder.overlaps == []
+    assert recorder.max_active <= 2
+    assert ('slow', {}) in results  # Prazo excedido conta como falha imediatamente
+    slow_starts = [t for host, t in recorder.calls if host == 'slow']
+    assert all(later - earlier >= 0.6 for earlier, later in zip(slow_starts, slow_starts[1:]))
+
+
+def test_failures_back_off_and_open_the_breaker():
+    calls = []
+
+    def collect(host, cancelled, metrics):
+        calls.append(time.monotonic())
+        return {'reachable': False}
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scheduler = AdaptiveScheduler(
+            executor, collect, lambda host, result: None, {'cpu_usage': 0.01}, max_parallel=1,
+            host_deadline=5, backoff_base=0.05, backoff_max=1, breaker_threshold=3, breaker_cooldown=60)
+        scheduler.set_hosts(['off'])
+        _run(scheduler, 0.8)
+        stats = scheduler.stats()
+
+    assert len(calls) == 3
+    assert calls[2] - calls[1] > calls[1] - calls[0]
+    assert stats['breaker_open'] == 1
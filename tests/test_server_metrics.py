@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+import requests
+from winrm.exceptions import WinRMOperationTimeoutError
+
+import server
+from metrics import ERRORS, HOST_COLLECT_SECONDS, Counter, Registry, SamplingProfiler
+
+
+class RaisingTransport:
+
+    def __init__(self, error):
+        self.error = error
+
+    def run(self, host, command, args=(), cancelled=None):
+        raise self.error
+
+
+def _errors(kind):
+    return dict(ERRORS._values).get((('kind', kind),), 0)
+
+
+@pytest.mark.parametrize('error, kind', [
+    (requests.exceptions.ReadTimeout("read timed out"), 'timeout'),
+    (requests.exceptions.ConnectTimeout("connect timed out"), 'timeout'),
+    (WinRMOperationTimeoutError(), 'timeout'),
+    (requests.exceptions.ConnectionError("connection refused"), 'connection'),
+    (RuntimeError("TimeoutHandler falhou"), 'connection'),  # O nome da classe não importa
+])
+def test_remote_errors_are_classified_by_exception_type(monkeypatch, error, kind):
+    monkeypatch.setattr(server, 'remote_transport', RaisingTransport(error))
+    before = _errors(kind)
+
+    assert server.execute_remote_ps('PC1', 'Get-Date') is None
+    assert _errors(kind) == before + 1
+
+
+def test_slowest_hosts_are_bounded_and_forget_removed_hosts(monkeypatch):
+    class FakeInventory:
+        def hosts(self):
+            return {'PC2': 'LAB', 'PC3': 'LAB'}
+
+    class FakeScheduler:
+        def set_hosts(self, hosts):
+            pass
+
+    monkeypatch.setattr(server, 'inventory', FakeInventory())
+    monkeypatch.setattr(server, 'scheduler', FakeScheduler())
+    monkeypatch.setattr(server, 'SLOW_HOSTS_REPORTED', 2)
+    monkeypatch.setattr(server, 'target_labs', {})
+    monkeypatch.setattr(server, 'computer_states', {})
+    monkeypatch.setattr(server, 'last_collect_seconds', {'PC1': 9.0, 'PC2': 3.0, 'PC3': 1.0})
+
+    assert server.slowest_hosts() == {'PC1': 9.0, 'PC2': 3.0}
+    server.refresh_targets()
+    assert server.slowest_hosts() == {'PC2': 3.0, 'PC3': 1.0}
+
+
+def test_host_collect_histogram_has_no_per_host_series(monkeypatch):
+    monkeypatch.setattr(server, 'remote_transport', RaisingTransport(requests.exceptions.ConnectionError()))
+    monkeypatch.setattr(server, 'last_collect_seconds', {})
+
+    server.collect_host('PC1', threading.Event(), ('cpu_usage',))
+
+    assert 'PC1' in server.last_collect_seconds
+    assert all('host=' not in line for line in HOST_COLLECT_SECONDS.samples())
+
+
+def test_label_less_counter_is_exported_as_zero():
+    registry = Registry()
+    Counter('teste_total', "Contador sem rótulos.", registry=registry)
+    Counter('teste_por_tipo_total', "Contador com rótulos.", ['kind'], registry=registry)
+
+    lines = registry.render().splitlines()
+    assert 'teste_total 0' in lines
+    assert not any(line.startswith('teste_por_tipo_total') for line in lines)
+
+
+def test_profiler_keeps_only_the_newest_profiles(tmp_path):
+    (tmp_path / 'notas.txt').write_text('não é perfil')
+    profiler = SamplingProfiler(max_files=2)
+    for minute in range(4):
+        profiler.dump(str(tmp_path / f"ciclo-20260101-00{minute:02d}00.folded"))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'ciclo-20260101-000200.folded', 'ciclo-20260101-000300.folded', 'notas.txt']
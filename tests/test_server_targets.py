@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+from sinks import Snapshot
+
+
+class FakeInventory:
+
+    def __init__(self, hosts):
+        self.current = hosts
+
+    def hosts(self):
+        return dict(self.current)
+
+
+class RecordingPublisher:
+    dropped = 0
+
+    def __init__(self):
+        self.snapshots = []
+
+    def publish(self, snapshot):
+        self.snapshots.append(snapshot)
+
+
+def test_empty_inventory_removes_every_host_from_scheduler_states_and_sheet(monkeypatch):
+    inventory = FakeInventory({'PC1': 'CTI', 'PC2': 'CTI'})
+    publisher = RecordingPublisher()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scheduler = server.build_scheduler(executor, lambda *args: {}, lambda *args: None)
+        for name, value in dict(inventory=inventory, scheduler=scheduler, publisher=publisher, target_labs={},
+                                computer_states={}, last_collect_seconds={}, last_publish=None,
+                                published_hosts=False).items():
+            monkeypatch.setattr(server, name, value)
+
+        server.publish_states()
+        assert publisher.snapshots == []  # Antes da primeira coleta a planilha não é tocada
+
+        server.refresh_targets()
+        server.store_result('PC1', {'reachable': True, 'cpu_usage': 5})
+        server.publish_states()
+        assert set(publisher.snapshots[-1].states) == {'PC1'}
+
+        inventory.current = {}
+        server.refresh_targets()
+        server.publish_states()
+
+    assert scheduler.stats()['hosts'] == 0
+    assert server.computer_states == {}
+    assert isinstance(publisher.snapshots[-1], Snapshot) and publisher.snapshots[-1].states == {}
@@ -0,0 +1,194 @@
+import threading
+import time
+
+import pytest
+from winrm.exceptions import WinRMOperationTimeoutError
+
+from session_pool import CommandCancelled, SessionPool
+
+
+class FakeProtocol:
+    """winrm.Protocol falso em memória.
+
+    dead=True simula uma máquina que reiniciou: o shell antigo não aceita mais comandos. hang=True faz
+    todo Receive estourar o operation timeout, como um comando que nunca termina.
+    """
+
+    def __init__(self, host, hang=False, poll_seconds=0.0):
+        self.host = host
+        self.hang = hang
+        self.poll_seconds = poll_seconds
+        self.dead = False
+        self.shells_open = 0
+        self.commands = []
+        self.cleaned = []
+
+    def open_shell(self):
+        self.shells_open += 1
+        return f"shell-{self.shells_open}"
+
+    def close_shell(self, shell_id):
+        self.shells_open -= 1
+
+    def run_command(self, shell_id, command, args=()):
+        if self.dead:
+            raise ConnectionResetError("shell remoto não existe mais")
+        self.commands.append(command)
+        return f"cmd-{len(self.commands)}"
+
+    def get_command_output_raw(self, shell_id, command_id):
+        time.sleep(self.poll_seconds)
+        if self.hang:
+            raise WinRMOperationTimeoutError()
+        return f"{self.host}:{command_id}".encode(), b'', 0, True
+
+    def cleanup_command(self, shell_id, command_id):
+        self.cleaned.append(command_id)
+
+
+class FakeFactory:
+
+    def __init__(self, **options):
+        self.options = options
+        self.protocols = []
+
+    def __call__(self, host):
+        self.protocols.append(FakeProtocol(host, **self.options))
+        return self.protocols[-1]
+
+    def opened(self, host):
+        return [p for p in self.protocols if p.host == host]
+
+
+def test_second_command_reuses_the_open_session():
+    factory = FakeFactory()
+    pool = SessionPool(factory)
+
+    assert pool.run('PC1', 'Get-Process') == (b'PC1:cmd-1', b'', 0)
+    assert pool.run('PC1', 'Get-Process') == (b'PC1:cmd-2', b'', 0)
+
+    assert len(factory.protocols) == 1
+    assert pool.stats() == dict(hits=1, misses=1, reconnects=0, evictions=0, overflow=0, probes=0,
+                                probe_failures=0, open=1, idle=1)
+
+
+def test_failed_command_on_a_reused_session_reconnects_once():
+    factory = FakeFactory()
+    pool = SessionPool(factory, probe_after=3600)
+    pool.run('PC1', 'Get-Process')
+    factory.protocols[0].dead = True
+
+    assert pool.run('PC1', 'Get-Process') == (b'PC1:cmd-1', b'', 0)
+
+    assert len(factory.protocols) == 2
+    assert factory.protocols[0].shells_open == 0
+    assert pool.stats()['reconnects'] == 1
+
+
+def test_failure_on_a_new_session_is_not_retried():
+    class DeadFactory(FakeFactory):
+        def __call__(self, host):
+            protocol = super().__call__(host)
+            protocol.dead = True
+            return protocol
+
+    factory = DeadFactory()
+    pool = SessionPool(factory)
+    with pytest.raises(ConnectionResetError):
+        pool.run('PC1', 'Get-Process')
+
+    assert len(factory.protocols) == 1
+    assert pool.stats()['open'] == 0
+
+
+def test_session_idle_past_probe_after_is_probed_before_reuse():
+    factory = FakeFactory()
+    pool = SessionPool(factory, probe_after=0.05)
+    pool.run('PC1', 'Get-Process')
+
+    pool.run('PC1', 'Get-Process')  # Logo em seguida: sem teste
+    time.sleep(0.1)
+    pool.run('PC1', 'Get-Process')  # Parada há mais de probe_after: testada e reaproveitada
+    assert factory.protocols[0].commands[-2:] == ['cmd.exe', 'Get-Process']
+
+    time.sleep(0.1)
+    factory.protocols[0].dead = True
+    assert pool.run('PC1', 'Get-Process') == (b'PC1:cmd-1', b'', 0)
+
+    stats = pool.stats()
+    assert (stats['probes'], stats['probe_failures'], stats['reconnects']) == (2, 1, 0)
+    assert (stats['hits'], stats['misses']) == (2, 2)
+    assert len(factory.protocols) == 2
+
+
+def test_evict_idle_closes_expired_sessions():
+    factory = FakeFactory()
+    pool = SessionPool(factory, max_idle=0.05)
+    pool.run('PC1', 'Get-Process')
+    pool.run('PC2', 'Get-Process')
+
+    time.sleep(0.1)
+    pool.run('PC2', 'Get-Process')  # Também expirada: reaberta no checkout
+    pool.evict_idle()
+
+    assert [p.shells_open for p in factory.protocols] == [0, 0, 1]
+    assert pool.stats()['evictions'] == 2
+    assert pool.stats()['open'] == 1
+
+
+def test_fleet_larger_than_max_sessions_keeps_reusing_the_pooled_sessions():
+    factory = FakeFactory()
+    pool = SessionPool(factory, max_sessions=64)
+    hosts = [f"PC{i:03d}" for i in range(300)]
+    for _ in range(3):
+        for host in hosts:
+            pool.run(host, 'Get-Process')
+
+    stats = pool.stats()
+    assert stats['hits'] == 64 * 2  # As 64 primeiras máquinas nunca perdem a sessão
+    assert stats['misses'] == 300 + 236 * 2
+    assert stats['evictions'] == 0
+    assert stats['open'] == 64
+    assert all(p.shells_open == 0 for p in factory.protocols if p.host not in hosts[:64])
+
+
+def test_max_sessions_sized_to_the_fleet_reuses_every_session():
+    factory = FakeFactory()
+    pool = SessionPool(factory, max_sessions=300)
+    hosts = [f"PC{i:03d}" for i in range(300)]
+    for _ in range(3):
+        for host in hosts:
+            pool.run(host, 'Get-Process')
+
+    assert (pool.stats()['hits'], pool.stats()['misses']) == (600, 300)
+    assert len(factory.protocols) == 300
+
+
+def test_probe_of_a_session_that_never_answers_gives_up_after_one_receive():
+    factory = FakeFactory()
+    pool = SessionPool(factory, probe_after=0)
+    pool.run('PC1', 'Get-Process')
+    factory.protocols[0].hang = True  # Aceita o comando, mas o Receive sempre estoura o prazo
+
+    start = time.monotonic()
+    assert pool.run('PC1', 'Get-Process') == (b'PC1:cmd-1', b'', 0)
+
+    assert time.monotonic() - start < 1
+    assert pool.stats()['probe_failures'] == 1
+    assert factory.protocols[0].shells_open == 0
+    assert len(factory.protocols) == 2
+
+
+def test_cancelling_a_running_command_terminates_it_and_keeps_the_session():
+    factory = FakeFactory(hang=True, poll_seconds=0.02)
+    pool = SessionPool(factory)
+    cancelled = threading.Event()
+    threading.Timer(0.1, cancelled.set).start()
+    start = time.monotonic()
+    with pytest.raises(CommandCancelled):
+        pool.run('PC1', 'Get-Process', cancelled=cancelled)
+
+    assert time.monotonic() - start < 1
+    assert factory.protocols[0].cleaned == ['cmd-1']
+    assert pool.stats()['idle'] == 1
+    assert pool.stats()['reconnects'] == 0
@@ -0,0 +1,193 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from simulation import MemoryWorksheet
+from sinks import CellRunDiffer, GoogleSheetSink, SinkPipeline, Snapshot, TableDiffer
+
+HEADER = ['Máquina', 'Status', 'CPU']
+
+
+def _table(*rows):
+    return [HEADER] + [list(row) for row in rows]
+
+
+def _apply(old, updates):
+    worksheet = MemoryWorksheet()
+    for r, row in enumerate(old):
+        for c, value in enumerate(row):
+            if value != '':
+                worksheet.cells[(r, c)] = value
+    worksheet.batch_update(updates)
+    return worksheet.get_all_values()
+
+
+def test_table_differ_is_abstract():
+    with pytest.raises(TypeError):
+        TableDiffer()
+
+
+def test_unchanged_table_produces_no_updates():
+    table = _table(['PC1', 'OK', '10'])
+    assert CellRunDiffer().diff(table, [list(row) for row in table]) == []
+
+
+def test_same_columns_in_consecutive_rows_become_one_range():
+    old = _table(['PC1', 'OK', '10'], ['PC2', 'OK', '20'], ['PC3', 'OK', '30'])
+    new = _table(['PC1', 'OK', '11'], ['PC2', 'OK', '21'], ['PC3', 'OK', '30'])
+    assert CellRunDiffer().diff(old, new) == [{'range': 'C2:C3', 'values': [['11'], ['21']]}]
+
+
+def test_added_host_is_written_and_following_rows_shift():
+    old = _table(['PC1', 'OK', '10'], ['PC3', 'OK', '30'])
+    new = _table(['PC1', 'OK', '10'], ['PC2', 'OK', '20'], ['PC3', 'OK', '30'])
+    updates = CellRunDiffer().diff(old, new)
+    assert _apply(old, updates) == new
+    assert all(not u['range'].startswith(('A1', 'A2')) for u in updates)
+
+
+def test_removed_host_blanks_the_leftover_row():
+    old = _table(['PC1', 'OK', '10'], ['PC2', 'OK', '20'], ['PC3', 'OK', '30'])
+    new = _table(['PC1', 'OK', '10'], ['PC3', 'OK', '30'])
+    updates = CellRunDiffer().diff(old, new)
+    assert updates[-1] == {'range': 'A4:C4', 'values': [['', '', '']]}
+    assert _apply(old, updates) == new
+
+
+def test_sheet_sink_sends_only_changes_and_grows_the_sheet():
+    worksheet = MemoryWorksheet(row_count=3)
+    sink = GoogleSheetSink('teste', None, open_worksheet=lambda: worksheet)
+
+    first = _table(['PC1', 'OK', '10'], ['PC2', 'OK', '20'])
+    assert sink.write_table(first) == 9
+    assert worksheet.get_all_values() == first
+
+    grown = _table(['PC1', 'OK', '10'], ['PC2', 'OK', '25'], ['PC3', 'Falha na Coleta', 'N/A'], ['PC4', 'OK', '5'])
+    calls = worksheet.api_calls
+    assert sink.write_table(grown) == 1 + 6
+    assert worksheet.row_count == 5
+    assert worksheet.api_calls - calls == 2  # add_rows + batch_update
+
+    shrunk = _table(['PC2', 'OK', '25'])
+    sink.write_table(shrunk)
+    assert worksheet.get_all_values() == shrunk
+
+    calls = worksheet.api_calls
+    assert sink.write_table(shrunk) == 0
+    assert worksheet.api_calls == calls
+
+
+def test_sheet_sink_rereads_the_sheet_after_a_failed_write():
+    class FlakyWorksheet(MemoryWorksheet):
+        fail = False
+
+        def batch_update(self, data, value_input_option=None):
+            if self.fail:
+                self.fail = False
+                raise ConnectionError("cota excedida")
+            super().batch_update(data, value_input_option)
+
+    worksheet = FlakyWorksheet()
+    opened = []
+    sink = GoogleSheetSink('teste', None, open_worksheet=lambda: opened.append(1) or worksheet)
+    sink.write_table(_table(['PC1', 'OK', '10']))
+
+    worksheet.fail = True
+    with pytest.raises(ConnectionError):
+        sink.write_table(_table(['PC1', 'OK', '11']))
+    sink.write_table(_table(['PC1', 'OK', '12']))
+
+    assert len(opened) == 2
+    assert worksheet.get_all_values() == _table(['PC1', 'OK', '12'])
+
+
+def test_pipeline_accounts_for_every_snapshot_under_concurrent_publishers():
+    class SlowSink:
+        name = 'lento'
+
+        def __init__(self):
+            self.written = 0
+
+        def write(self, snapshot):
+            time.sleep(0.001)
+            self.written += 1
+
+    sink = SlowSink()
+    pipeline = SinkPipeline([sink], max_pending=2)
+    pipeline.start()
+
+    def publish_many():
+        for i in range(500):
+            pipeline.publish(Snapshot(datetime.now(), {'PC': {'cpu_usage': i}}))
+
+    publishers = [threading.Thread(target=publish_many) for _ in range(4)]
+    for thread in publishers:
+        thread.start()
+    for thread in publishers:
+        thread.join()
+    pipeline.stop(timeout=5)
+
+    assert sink.written + pipeline.dropped == 4 * 500
+    assert pipeline.dropped > 0
+
+
+class FailingSink:
+    """Falha nas primeiras failures gravações; on_failure é chamado a cada falha."""
+    name = 'instavel'
+
+    def __init__(self, failures, on_failure=lambda: None):
+        self.failures = failures
+        self.on_failure = on_failure
+        self.attempts = 0
+        self.written = []
+
+    def write(self, snapshot):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            self.on_failure()
+            raise ConnectionError("destino fora do ar")
+        self.written.append(snapshot)
+
+
+def test_stale_wakeup_does_not_abandon_the_retry():
+    pipeline = SinkPipeline([], max_retries=3, retry_backoff=0.01)
+    # Evento marcado com a fila vazia, como no entrelaçamento entre _put() e a leitura da fila
+    sink = FailingSink(1, on_failure=pipeline._newer.set)
+    pipeline.sinks = [sink]
+    pipeline.start()
+    snapshot = Snapshot(datetime.now(), {'PC': {}})
+    pipeline.publish(snapshot)
+    pipeline.stop(timeout=5)
+
+    assert sink.attempts == 2
+    assert sink.written == [snapshot]
+
+
+def test_stop_finishes_the_snapshot_being_retried():
+    sink = FailingSink(2)
+    pipeline = SinkPipeline([sink], max_retries=5, retry_backoff=0.05)
+    pipeline.start()
+    snapshot = Snapshot(datetime.now(), {'PC': {}})
+    pipeline.publish(snapshot)
+    time.sleep(0.01)  # Primeira tentativa já falhou; stop() chega durante a espera
+    pipeline.stop(timeout=5)
+
+    assert sink.written == [snapshot]
+    assert not pipeline._thread.is_alive()
+
+
+def test_newer_snapshot_replaces_the_one_being_retried():
+    sink = FailingSink(1)
+    pipeline = SinkPipeline([sink], max_retries=5, retry_backoff=5)
+    pipeline.start()
+    first, second = Snapshot(datetime.now(), {'PC': {'cpu_usage': 1}}), Snapshot(datetime.now(), {'PC': {'cpu_usage': 2}})
+    pipeline.publish(first)
+    time.sleep(0.05)
+    start = time.monotonic()
+    pipeline.publish(second)
+    pipeline.stop(timeout=5)
+
+    assert time.monotonic() - start < 1
+    assert sink.written == [second]
@@ -0,0 +1,215 @@
+"""Benchmark do servidor contra uma frota simulada (ver simulation.py).
+
+Para cada tamanho de frota, roda o mesmo caminho do monitor_loop: o agendador adaptativo coleta as
+máquinas, store_result mescla os resultados em computer_states e publish_states envia snapshots pelo
+SinkPipeline à planilha em memória a cada MONITOR_INTERVAL. Informa o tempo da primeira varredura
+completa da frota, a latência por máquina (p50/p99), quantas máquinas devidas esperavam vaga, a memória
+ocupada por computer_states e, por ciclo, as coletas e as chamadas à API da planilha. Os tempos são
+convertidos para segundos simulados, ou seja, já divididos por --time-scale. Se o agendador parar ou a
+medição passar de --timeout, o benchmark termina com erro em vez de ficar esperando.
+
+    python benchmark.py --sizes 10,100,1000,5000 --time-scale 0.05
+    python benchmark.py --output base.json          # grava os resultados
+    python benchmark.py --baseline base.json        # compara e sai com código 1 se houver regressão
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import server
+from simulation import SimulatedFleet, MemoryWorksheet
+from sinks import GoogleSheetSink, SinkPipeline
+
+REGRESSION_TOLERANCE = 0.2  # Piora relativa tolerada em relação à linha de base
+COMPARED_KEYS = ('sweep_time', 'p99', 'max_due_backlog', 'states_bytes', 'collections_per_cycle', 'api_calls')
+
+
+def deep_sizeof(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+@contextlib.contextmanager
+def patched(module, **values):
+    """Substitui atributos do módulo durante o bloco e restaura os valores originais ao sair."""
+    original = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in original.items():
+            setattr(module, name, value)
+
+
+def time_budget(size, args):
+    """Tempo máximo (s simulados) da medição: --timeout ou, sem ele, a varredura no pior caso (todas as
+    máquinas esgotando HOST_DEADLINE) mais os ciclos medidos e uma folga de dois ciclos."""
+    if args.timeout:
+        return args.timeout
+    rounds = -(-size // args.parallel)
+    return rounds * server.HOST_DEADLINE + (args.cycles + 2) * server.MONITOR_INTERVAL
+
+
+def _check_progress(runner, deadline, waiting_for):
+    if not runner.is_alive():
+        raise RuntimeError(f"o agendador parou enquanto o benchmark aguardava {waiting_for}")
+    if time.perf_counter() > deadline:
+        raise RuntimeError(f"tempo esgotado aguardando {waiting_for}")
+
+
+def run_size(size, args):
+    scale = args.time_scale
+    fleet = SimulatedFleet(size, latency_median=args.latency, failure_rate=args.failure_rate,
+                           timeout_rate=args.timeout_rate, time_scale=scale, seed=args.seed)
+    worksheet = MemoryWorksheet()
+    publisher = SinkPipeline([GoogleSheetSink("benchmark", server.build_sheet_table, open_worksheet=lambda: worksheet)],
+                             max_pending=server.PUBLISH_QUEUE_SIZE)
+
+    latencies = []
+    seen = set()
+    swept = threading.Event()
+    lock = threading.Lock()
+
+    def timed_collect(computer, cancelled, metrics):
+        start = time.perf_counter()
+        try:
+            return server.collect_host(computer, cancelled, metrics)
+        finally:
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                seen.add(computer)
+                if len(seen) == size:
+                    swept.set()
+
+    executor = ThreadPoolExecutor(max_workers=args.parallel, thread_name_prefix='coletor')
+    scheduler = server.build_scheduler(executor, timed_collect, server.store_result,
+                                       max_parallel=args.parallel, time_scale=scale)
+    ticks = []  # (coletas, chamadas à API, células enviadas, máquinas devidas) a cada publicação
+
+    def tick():
+        with lock:
+            collections = len(latencies)
+        ticks.append((collections, worksheet.api_calls, worksheet.cells_written, scheduler.due_backlog()))
+
+    states = {}
+    with patched(server, remote_transport=fleet, computer_states=states, target_labs=dict.fromkeys(fleet.hosts, 'LAB'),
+                 publisher=publisher, scheduler=scheduler, last_publish=None), \
+            open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        publisher.start()
+        scheduler.set_hosts(fleet.hosts)
+        scheduler.every(server.MONITOR_INTERVAL * scale, server.publish_states)
+        scheduler.every(server.MONITOR_INTERVAL * scale, tick)
+        runner = threading.Thread(target=scheduler.run, name='agendador')
+        start = time.perf_counter()
+        deadline = start + time_budget(size, args) * scale
+        runner.start()
+        try:
+            while not swept.wait(0.01):
+                _check_progress(runner, deadline, f"a primeira varredura das {size} máquinas")
+            sweep_time = time.perf_counter() - start
+            first_steady = len(ticks)
+            while len(ticks) < first_steady + args.cycles + 1:
+                _check_progress(runner, deadline, f"{args.cycles} ciclos após a varredura")
+                time.sleep(0.01)
+        finally:
+            scheduler.stop()
+            runner.join()
+            executor.shutdown(wait=True, cancel_futures=True)
+            publisher.stop()
+
+    # Ciclos estáveis: entre as publicações feitas depois da primeira varredura completa
+    steady = ticks[first_steady:]
+    cycles = len(steady) - 1
+    return {
+        'size': size,
+        'sweep_time': sweep_time / scale,
+        'p50': percentile(latencies, 50) / scale,
+        'p99': percentile(latencies, 99) / scale,
+        'max_due_backlog': max(t[3] for t in steady),
+        'states_bytes': deep_sizeof(states),
+        'collections_per_cycle': (steady[-1][0] - steady[0][0]) / cycles,
+        'api_calls': (steady[-1][1] - steady[0][1]) / cycles,
+        'cells_written': (steady[-1][2] - steady[0][2]) / cycles,
+        'dropped': publisher.dropped,
+        'failed': sum(1 for s in states.values() if not s.get('reachable')),
+    }
+
+
+def compare(results, baseline):
+    regressions = []
+    previous = {r['size']: r for r in baseline}
+    for result in results:
+        base = previous.get(result['size'])
+        if not base:
+            continue
+        for key in COMPARED_KEYS:
+            if base.get(key) and result[key] > base[key] * (1 + REGRESSION_TOLERANCE):
+                regressions.append(f"{result['size']} máquinas: {key} {base[key]:.2f} -> {result[key]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,5000', help="tamanhos de frota separados por vírgula")
+    parser.add_argument('--cycles', type=int, default=3, help="ciclos medidos após a primeira varredura completa")
+    parser.add_argument('--parallel', type=int, default=server.MAX_PARALLEL_HOSTS)
+    parser.add_argument('--latency', type=float, default=0.8, help="latência mediana por máquina (s simulados)")
+    parser.add_argument('--failure-rate', type=float, default=0.02)
+    parser.add_argument('--timeout-rate', type=float, default=0.01)
+    parser.add_argument('--time-scale', type=float, default=0.05, help="fator aplicado a todas as esperas simuladas")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, help="limite (s simulados) de cada tamanho; padrão: estimado pelo pior caso")
+    parser.add_argument('--output', help="grava os resultados neste arquivo JSON")
+    parser.add_argument('--baseline', help="compara com resultados gravados anteriormente com --output")
+    args = parser.parse_args()
+
+    print(f"{'Máquinas':>8} {'Varredura (s)':>13} {'p50 (s)':>8} {'p99 (s)':>8} {'Devidas':>8} {'Memória (KiB)':>14} "
+          f"{'Coletas/ciclo':>13} {'API/ciclo':>9} {'Células/ciclo':>13} {'Falhas':>7}")
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        try:
+            result = run_size(size, args)
+        except RuntimeError as e:
+            print(f"ERRO no benchmark com {size} máquinas: {e}")
+            sys.exit(2)
+        results.append(result)
+        r = result
+        print(f"{size:>8} {r['sweep_time']:>13.1f} {r['p50']:>8.2f} {r['p99']:>8.2f} {r['max_due_backlog']:>8} "
+              f"{r['states_bytes'] / 1024:>14.0f} {r['collections_per_cycle']:>13.0f} {r['api_calls']:>9.1f} "
+              f"{r['cells_written']:>13.0f} {r['failed']:>7}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f))
+        for line in regressions:
+            print(f"REGRESSÃO: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
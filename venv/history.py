@@ -0,0 +1,262 @@
+"""Histórico compacto das métricas de cada máquina em SQLite.
+
+O histórico é um destino do SinkPipeline (ver sinks.py): cada snapshot publicado vira uma amostra por
+máquina. Para manter o banco pequeno e a memória do servidor constante:
+
+- nomes de máquinas, laboratórios, processos e usuários são internados na tabela names e as demais
+  tabelas guardam apenas os ids;
+- a lista de processos é gravada como diferença (processos que surgiram / que terminaram) em relação
+  ao snapshot anterior, com uma lista completa (keyframe) a cada keyframe_every gravações;
+- as amostras brutas são agregadas em blocos de 5 minutos e depois de 1 hora, e cada nível é apagado
+  após o seu período de retenção.
+
+Os agregados guardam somas e contagens, não médias, para que o nível horário possa ser calculado a
+partir do de 5 minutos sem perda de precisão.
+"""
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+FIVE_MINUTES = 300
+ONE_HOUR = 3600
+NO_ACTIVE_SESSION = -1  # Valor de idle quando não há usuário logado
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS names (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS hosts (id INTEGER PRIMARY KEY, lab INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS samples (
+    host INTEGER NOT NULL, ts INTEGER NOT NULL, reachable INTEGER NOT NULL,
+    cpu INTEGER, mem INTEGER, idle INTEGER,
+    PRIMARY KEY (host, ts)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+CREATE TABLE IF NOT EXISTS process_snapshots (
+    host INTEGER NOT NULL, ts INTEGER NOT NULL, keyframe INTEGER NOT NULL,
+    added TEXT NOT NULL, removed TEXT NOT NULL,
+    PRIMARY KEY (host, ts)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    level INTEGER NOT NULL, host INTEGER NOT NULL, bucket INTEGER NOT NULL,
+    samples INTEGER NOT NULL, reachable INTEGER NOT NULL,
+    cpu_sum INTEGER NOT NULL, cpu_n INTEGER NOT NULL, mem_sum INTEGER NOT NULL, mem_n INTEGER NOT NULL,
+    idle_samples INTEGER NOT NULL,
+    PRIMARY KEY (level, host, bucket)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rollups_bucket ON rollups (level, bucket);
+CREATE TABLE IF NOT EXISTS watermarks (level INTEGER PRIMARY KEY, rolled_until INTEGER NOT NULL);
+"""
+
+
+def _as_int(value):
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+def _encode_idle(idle_time):
+    if isinstance(idle_time, str):
+        return NO_ACTIVE_SESSION
+    return _as_int(idle_time)
+
+
+class _PendingCaches:
+    """Ids de nomes, laboratórios e listas de processos produzidos por uma gravação ainda não confirmada."""
+    __slots__ = ('names', 'host_labs', 'processes')
+
+    def __init__(self):
+        self.names = {}
+        self.host_labs = {}
+        self.processes = {}
+
+
+class HistoryStore:
+    """Destino que grava cada snapshot no histórico e oferece consultas sobre ele."""
+    name = 'history'
+
+    def __init__(self, path, default_lab='', idle_threshold=15, keyframe_every=60,
+                 raw_retention=2 * 86400, five_min_retention=30 * 86400, hourly_retention=400 * 86400,
+                 maintenance_interval=FIVE_MINUTES, rollup_grace=120):
+        self.default_lab = default_lab
+        self.idle_threshold = idle_threshold
+        self.keyframe_every = keyframe_every
+        self.retention = {0: raw_retention, FIVE_MINUTES: five_min_retention, ONE_HOUR: hourly_retention}
+        self.maintenance_interval = maintenance_interval
+        self.rollup_grace = rollup_grace
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._name_ids = dict(self._conn.execute("SELECT name, id FROM names"))
+        self._names = {v: k for k, v in self._name_ids.items()}
+        self._host_labs = dict(self._conn.execute("SELECT id, lab FROM hosts"))
+        self._last_processes = {}  # host id -> (frozenset de (pid, nome, usuário), gravações desde o keyframe)
+        self._last_maintenance = 0
+
+    # --- gravação ---
+
+    def write(self, snapshot):
+        ts = int(snapshot.taken_at.timestamp())
+        # Os caches só recebem os ids e processos novos depois do commit; se a transação for desfeita
+        # (banco travado, disco cheio), eles continuam iguais ao banco e a repetição grava tudo de novo.
+        pending = _PendingCaches()
+        with self._lock:
+            with self._conn:
+                samples, process_rows = [], []
+                for computer, data in snapshot.states.items():
+                    host = self._intern(computer, pending)
+                    self._set_lab(host, self._intern(data.get('lab') or self.default_lab, pending), pending)
+                    reachable = bool(data.get('reachable'))
+                    samples.append((host, ts, int(reachable), _as_int(data.get('cpu_usage')),
+                                    _as_int(data.get('mem_usage')), _encode_idle(data.get('idle_time'))))
+                    if reachable and 'processes' in data:
+                        row = self._process_delta(host, ts, data['processes'], pending)
+                        if row:
+                            process_rows.append(row)
+                self._conn.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)", samples)
+                self._conn.executemany("INSERT OR REPLACE INTO process_snapshots VALUES (?, ?, ?, ?, ?)", process_rows)
+            self._name_ids.update(pending.names)
+            self._names.update((v, k) for k, v in pending.names.items())
+            self._host_labs.update(pending.host_labs)
+            self._last_processes.update(pending.processes)
+
+        if time.monotonic() - self._last_maintenance >= self.maintenance_interval:
+            self.run_maintenance()
+
+    def _intern(self, name, pending):
+        name_id = self._name_ids.get(name) or pending.names.get(name)
+        if name_id is None:
+            name_id = self._conn.execute("INSERT INTO names (name) VALUES (?)", (name,)).lastrowid
+            pending.names[name] = name_id
+        return name_id
+
+    def _set_lab(self, host, lab, pending):
+        if pending.host_labs.get(host, self._host_labs.get(host)) != lab:
+            self._conn.execute("INSERT OR REPLACE INTO hosts VALUES (?, ?)", (host, lab))
+            pending.host_labs[host] = lab
+
+    def _process_delta(self, host, ts, processes, pending):
+        current = frozenset(
+            (p.get('Id'), self._intern(p.get('ProcessName') or '', pending),
+             self._intern(p.get('UserName') or '', pending))
+            for p in processes if isinstance(p, dict))
+        previous, since_keyframe = self._last_processes.get(host, (None, 0))
+        if previous is None or since_keyframe + 1 >= self.keyframe_every:
+            pending.processes[host] = (current, 0)
+            return (host, ts, 1, json.dumps(sorted(current), separators=(',', ':')), '[]')
+
+        added = current - previous
+        removed = previous - current
+        if not added and not removed:
+            return None
+        pending.processes[host] = (current, since_keyframe + 1)
+        return (host, ts, 0, json.dumps(sorted(added), separators=(',', ':')),
+                json.dumps(sorted(p[0] for p in removed), separators=(',', ':')))
+
+    # --- agregação e retenção ---
+
+    def run_maintenance(self, now=None):
+        """Agrega amostras em blocos de 5 min e 1 h e apaga o que passou da retenção."""
+        now = int(now if now is not None else time.time())
+        with self._lock, self._conn:
+            self._rollup(FIVE_MINUTES, now)
+            self._rollup(ONE_HOUR, now)
+            self._apply_retention(now)
+        self._last_maintenance = time.monotonic()
+
+    def _watermark(self, level):
+        row = self._conn.execute("SELECT rolled_until FROM watermarks WHERE level = ?", (level,)).fetchone()
+        return row[0] if row else 0
+
+    def _rollup(self, level, now):
+        start = self._watermark(level)
+        until = (now - self.rollup_grace) // level * level
+        if level == ONE_HOUR:
+            # Só agrega horas cujos blocos de 5 minutos já estão completos
+            until = min(until, self._watermark(FIVE_MINUTES) // level * level)
+        if until <= start:
+            return
+
+        if level == FIVE_MINUTES:
+            source = f"""
+                SELECT {level}, host, ts / {level} * {level}, COUNT(*), SUM(reachable),
+                       TOTAL(cpu), COUNT(cpu), TOTAL(mem), COUNT(mem),
+                       COALESCE(SUM(idle = {NO_ACTIVE_SESSION} OR idle >= ?), 0)
+                FROM samples WHERE ts >= ? AND ts < ? GROUP BY host, ts / {level}"""
+            params = (self.idle_threshold, start, until)
+        else:
+            source = f"""
+                SELECT {level}, host, bucket / {level} * {level}, SUM(samples), SUM(reachable),
+                       SUM(cpu_sum), SUM(cpu_n), SUM(mem_sum), SUM(mem_n), SUM(idle_samples)
+                FROM rollups WHERE level = {FIVE_MINUTES} AND bucket >= ? AND bucket < ?
+                GROUP BY host, bucket / {level}"""
+            params = (start, until)
+
+        self._conn.execute(f"""
+            INSERT INTO rollups {source}
+            ON CONFLICT (level, host, bucket) DO UPDATE SET
+                samples = samples + excluded.samples, reachable = reachable + excluded.reachable,
+                cpu_sum = cpu_sum + excluded.cpu_sum, cpu_n = cpu_n + excluded.cpu_n,
+                mem_sum = mem_sum + excluded.mem_sum, mem_n = mem_n + excluded.mem_n,
+                idle_samples = idle_samples + excluded.idle_samples""", params)
+        self._conn.execute("INSERT OR REPLACE INTO watermarks VALUES (?, ?)", (level, until))
+
+    def _apply_retention(self, now):
+        raw_cutoff = now - self.retention[0]
+        self._conn.execute("DELETE FROM samples WHERE ts < ?", (raw_cutoff,))
+        # Mantém o último keyframe anterior ao corte, necessário para reconstruir os snapshots seguintes
+        self._conn.execute("""
+            DELETE FROM process_snapshots WHERE ts < (
+                SELECT MAX(k.ts) FROM process_snapshots k
+                WHERE k.host = process_snapshots.host AND k.keyframe AND k.ts <= ?)""", (raw_cutoff,))
+        for level in (FIVE_MINUTES, ONE_HOUR):
+            self._conn.execute("DELETE FROM rollups WHERE level = ? AND bucket < ?", (level, now - self.retention[level]))
+
+    # --- consultas ---
+
+    def idle_hours_per_lab_per_day(self, start, end):
+        """Horas ociosas somadas por laboratório e dia (horário local) entre os datetimes start e end.
+
+        Uma amostra conta como ociosa quando não há usuário logado ou o tempo ocioso é de pelo menos
+        idle_threshold minutos; máquinas inacessíveis não contam. Usa os agregados horários e, para as
+        horas ainda não agregadas, os de 5 minutos; os últimos minutos ainda não agregados ficam de fora.
+        """
+        with self._lock:
+            hourly_until = self._watermark(ONE_HOUR)
+            rows = self._conn.execute(f"""
+                SELECT lab.name, date(r.bucket, 'unixepoch', 'localtime') AS day,
+                       SUM(r.level * 1.0 * r.idle_samples / r.samples) / 3600
+                FROM rollups r JOIN hosts h ON h.id = r.host JOIN names lab ON lab.id = h.lab
+                WHERE r.bucket >= ? AND r.bucket < ?
+                  AND ((r.level = {ONE_HOUR} AND r.bucket < ?) OR (r.level = {FIVE_MINUTES} AND r.bucket >= ?))
+                GROUP BY lab.name, day ORDER BY day, lab.name""",
+                (int(start.timestamp()), int(end.timestamp()), hourly_until, hourly_until)).fetchall()
+        return [(lab, day, round(hours, 2)) for lab, day, hours in rows]
+
+    def host_samples(self, computer, start, end):
+        """Amostras brutas de uma máquina: lista de (datetime, acessível, cpu, memória, ocioso)."""
+        with self._lock:
+            host = self._name_ids.get(computer)
+            rows = self._conn.execute(
+                "SELECT ts, reachable, cpu, mem, idle FROM samples WHERE host = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (host, int(start.timestamp()), int(end.timestamp()))).fetchall()
+        return [(datetime.fromtimestamp(ts), bool(reachable), cpu, mem,
+                 "Nenhum usuário logado" if idle == NO_ACTIVE_SESSION else idle)
+                for ts, reachable, cpu, mem, idle in rows]
+
+    def processes_at(self, computer, when):
+        """Reconstrói a lista de processos da máquina no instante when, no formato coletado."""
+        with self._lock:
+            host = self._name_ids.get(computer)
+            ts = int(when.timestamp())
+            keyframe = self._conn.execute(
+                "SELECT MAX(ts) FROM process_snapshots WHERE host = ? AND keyframe AND ts <= ?", (host, ts)).fetchone()[0]
+            if keyframe is None:
+                return []
+            rows = self._conn.execute(
+                "SELECT added, removed FROM process_snapshots WHERE host = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+                (host, keyframe, ts)).fetchall()
+            processes = {}
+            for added, removed in rows:
+                for pid in json.loads(removed):
+                    processes.pop(pid, None)
+                for pid, name, user in json.loads(added):
+                    processes[pid] = (name, user)
+            return [{'Id': pid, 'ProcessName': self._names[name], 'UserName': self._names[user] or None}
+                    for pid, (name, user) in sorted(processes.items())]
@@ -0,0 +1,166 @@
+"""Inventário das máquinas monitoradas, lido do Active Directory em segundo plano.
+
+A lista de máquinas de cada OU fica em cache e é atualizada por uma thread própria a cada ttl
+segundos, de modo que o coletor nunca espera pelo AD. As atualizações comuns pedem ao AD apenas os
+objetos alterados desde o maior whenChanged já visto na OU; a cada full_refresh_interval a OU inteira
+é relida, o que detecta máquinas removidas ou movidas para outra OU. Se o AD não responder, o último
+inventário válido continua em uso. Uma releitura completa que volta vazia para uma OU que tinha máquinas
+é tratada como falha, a menos que se repita em empty_reads_to_accept leituras seguidas (laboratório
+realmente desativado). Com cache_path, o inventário também sobrevive a reinícios do servidor.
+
+A consulta ao AD fica em um backend com o método fetch(ou_dn, changed_since), que devolve uma lista
+de (nome, whenChanged em UTC) e levanta exceção em caso de falha. Isso permite trocar o PowerShell por
+um diretório falso local nos testes.
+"""
+import json
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+
+from metrics import ERRORS, PHASE_SECONDS
+
+
+class PowerShellADBackend:
+    """Consulta o AD com o módulo ActiveDirectory do PowerShell da máquina do servidor."""
+
+    def fetch(self, ou_dn, changed_since=None):
+        if changed_since is None:
+            query = "$filter = '*'"
+        else:
+            # Aspas simples: quem resolve $since dentro do filtro é o próprio módulo ActiveDirectory
+            query = (f"$since = [datetime]::Parse('{changed_since.isoformat()}', $null, 'RoundtripKind'); "
+                     "$filter = 'whenChanged -ge $since'")
+        ps_command = (
+            f"Import-Module ActiveDirectory; {query}; "
+            f'ConvertTo-Json -Compress @(Get-ADComputer -Filter $filter -SearchBase "{ou_dn}" -Properties whenChanged | '
+            "Select-Object Name, @{n='whenChanged';e={$_.whenChanged.ToUniversalTime().ToString('o')}})"
+        )
+        result = subprocess.run(['powershell', '-Command', ps_command], capture_output=True, text=True, check=True)
+        output = result.stdout.strip()
+        if not output:
+            return []
+        items = json.loads(output)
+        if isinstance(items, dict):
+            items = [items]
+        return [(item['Name'].strip(), datetime.fromisoformat(item['whenChanged'].replace('Z', '+00:00')))
+                for item in items if item.get('Name')]
+
+
+class StaticDirectoryBackend:
+    """Diretório em memória: {ou_dn: {nome: whenChanged}}. Útil para testes e simulações."""
+
+    def __init__(self, ous=None):
+        self.ous = ous or {}
+
+    def fetch(self, ou_dn, changed_since=None):
+        computers = self.ous.get(ou_dn, {})
+        return [(name, changed) for name, changed in computers.items()
+                if changed_since is None or changed >= changed_since]
+
+
+class Inventory:
+    """Mantém em cache as máquinas de várias OUs, cada uma associada ao nome do seu laboratório."""
+
+    def __init__(self, backend, ous, ttl=300, full_refresh_interval=3600, cache_path=None, overlap=60,
+                 empty_reads_to_accept=3):
+        self.backend = backend
+        self.ous = dict(ous)  # ou_dn -> nome do laboratório
+        self.ttl = ttl
+        self.full_refresh_interval = full_refresh_interval
+        self.cache_path = cache_path
+        self.overlap = timedelta(seconds=overlap)
+        self.empty_reads_to_accept = empty_reads_to_accept
+        self._computers = {ou: {} for ou in self.ous}  # ou_dn -> {nome: whenChanged}
+        self._last_full = {}
+        self._empty_reads = {}  # ou_dn -> leituras completas vazias seguidas
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='inventario', daemon=True)
+        self._load_cache()
+
+    def start(self):
+        """Faz a primeira leitura (bloqueante) e inicia a atualização em segundo plano."""
+        self.refresh()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def hosts(self):
+        """Último inventário válido: {máquina: laboratório}."""
+        with self._lock:
+            return {name: self.ous[ou] for ou, computers in self._computers.items() for name in computers}
+
+    def refresh(self):
+        """Atualiza todas as OUs; uma OU que falhar mantém a lista anterior."""
+        changed = False
+        for ou in self.ous:
+            try:
+                with PHASE_SECONDS.time(phase='inventory'):
+                    changed |= self._refresh_ou(ou)
+            except Exception as e:
+                ERRORS.inc(kind='ad')
+                print(f"ERRO ao buscar computadores no AD (OU {ou}): {e}. Mantendo o último inventário.")
+        if changed:
+            self._save_cache()
+
+    def _refresh_ou(self, ou):
+        with self._lock:
+            known = dict(self._computers[ou])
+        full = not known or time.monotonic() - self._last_full.get(ou, float('-inf')) >= self.full_refresh_interval
+
+        if full:
+            print(f"Buscando computadores na OU: {ou}")
+            found = dict(self.backend.fetch(ou))
+            if not found and known:
+                empty_reads = self._empty_reads[ou] = self._empty_reads.get(ou, 0) + 1
+                if empty_reads < self.empty_reads_to_accept:
+                    raise RuntimeError(f"o AD devolveu uma OU vazia ({empty_reads}/{self.empty_reads_to_accept})")
+                print(f"OU {self.ous[ou]} vazia em {empty_reads} leituras seguidas; removendo as suas máquinas.")
+            self._empty_reads.pop(ou, None)
+            self._last_full[ou] = time.monotonic()
+            updated = found
+        else:
+            since = max(known.values()) - self.overlap
+            updated = {**known, **dict(self.backend.fetch(ou, since))}
+
+        if updated == known:
+            return False
+        added, removed = updated.keys() - known.keys(), known.keys() - updated.keys()
+        if added or removed:
+            print(f"Inventário da OU {self.ous[ou]}: {len(added)} máquina(s) nova(s), {len(removed)} removida(s).")
+        with self._lock:
+            self._computers[ou] = updated
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.ttl):
+            self.refresh()
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+            for ou in self.ous:
+                self._computers[ou] = {name: datetime.fromisoformat(changed)
+                                       for name, changed in cached.get(ou, {}).items()}
+        except Exception as e:
+            print(f"ERRO ao ler o cache do inventário '{self.cache_path}': {e}")
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = {ou: {name: changed.isoformat() for name, changed in computers.items()}
+                    for ou, computers in self._computers.items()}
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"ERRO ao gravar o cache do inventário '{self.cache_path}': {e}")
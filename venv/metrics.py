@@ -0,0 +1,279 @@
+"""Instrumentação do próprio servidor: métricas no formato texto do Prometheus e perfis por ciclo.
+
+As métricas ficam em REGISTRY e são servidas por start_http_server em /metrics. Os pontos críticos do
+coletor usam as métricas definidas no fim deste módulo; valores que já existem em outros objetos
+(profundidade de filas, contadores do pool de sessões) são lidos na hora da consulta por CallbackMetric.
+
+SamplingProfiler amostra periodicamente a pilha de todas as threads e grava, a cada dump(), as pilhas
+agregadas no formato "collapsed" (uma linha "f1;f2;f3 contagem"), aceito por flamegraph.pl e speedscope.
+Só os max_files perfis mais recentes de cada diretório são mantidos.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} espera os rótulos {self.labelnames}, recebeu {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        if not self.labelnames:
+            self._values[()] = 0  # Sem rótulos a série existe desde o início, valendo 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(counts), total, count) for k, (counts, total, count) in self._values.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class CallbackMetric:
+    """Métrica lida no momento da consulta: func() devolve um número ou, com labelname, um dicionário
+    {valor do rótulo: número}."""
+
+    def __init__(self, name, help, func, kind='gauge', labelname=None, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.kind = kind
+        self.labelname = labelname
+        registry.register(self)
+
+    def samples(self):
+        try:
+            values = self.func()
+        except Exception:
+            return []
+        if self.labelname is None:
+            return [f"{self.name} {_format_value(values)}"]
+        return [f"{self.name}{_format_labels(((self.labelname, k),))} {_format_value(v)}" for k, v in values.items()]
+
+
+def start_http_server(port, address='127.0.0.1', registry=REGISTRY):
+    """Serve as métricas em http://address:port/metrics numa thread em segundo plano."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((address, port), Handler)
+    threading.Thread(target=httpd.serve_forever, name='metricas', daemon=True).start()
+    print(f"Métricas disponíveis em http://{address}:{port}/metrics")
+    return httpd
+
+
+class SamplingProfiler:
+    """Amostra a pilha de todas as threads a cada interval segundos, sem instrumentar o código."""
+    SUFFIX = '.folded'
+
+    def __init__(self, interval=0.01, max_files=None):
+        self.interval = interval
+        self.max_files = max_files
+        self._stacks = _StackCounter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='perfilador', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def dump(self, path):
+        """Grava as pilhas acumuladas desde o último dump e recomeça a contagem.
+
+        Com max_files definido, apaga os perfis (*.folded) mais antigos do diretório de path, de modo
+        que restem no máximo max_files; os nomes devem ordenar cronologicamente.
+        """
+        with self._lock:
+            stacks, self._stacks = self._stacks, _StackCounter()
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        if self.max_files:
+            self._prune(os.path.dirname(path) or '.')
+
+    def _prune(self, directory):
+        profiles = sorted(name for name in os.listdir(directory) if name.endswith(self.SUFFIX))
+        for name in profiles[:-self.max_files]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError as e:
+                print(f"AVISO: não foi possível apagar o perfil antigo '{name}': {e}")
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            samples = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                parts.append(names.get(ident, str(ident)))
+                samples.append(';'.join(reversed(parts)))
+            with self._lock:
+                self._stacks.update(samples)
+
+
+# --- Métricas do coletor ---
+
+PHASE_SECONDS = Histogram(
+    'idlewatch_phase_seconds', "Duração de cada etapa do coletor.", ['phase'])
+# Sem rótulo por máquina, para o número de séries não crescer com a frota; as mais lentas são expostas
+# à parte pelo servidor (idlewatch_slowest_hosts_seconds)
+HOST_COLLECT_SECONDS = Histogram(
+    'idlewatch_host_collect_seconds', "Duração da coleta de uma máquina.",
+    buckets=(0.5, 1, 2, 5, 10, 20, 45, 90))
+ERRORS = Counter(
+    'idlewatch_errors_total', "Falhas por tipo: connection, timeout, powershell, parse, deadline, sink, ad.", ['kind'])
+SCHEDULE_LAG_SECONDS = Histogram(
+    'idlewatch_schedule_lag_seconds', "Atraso entre o horário devido de uma coleta e o seu início.",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300))
+CYCLE_SECONDS = Histogram(
+    'idlewatch_cycle_seconds',
+    "Intervalo entre publicações consecutivas do estado na thread do agendador (não mede o tempo de coleta).",
+    buckets=(30, 60, 65, 75, 90, 120, 300, 600))
+CYCLE_OVERRUNS = Counter(
+    'idlewatch_cycle_overruns_total',
+    "Publicações iniciadas mais de 1 s depois do intervalo configurado (atraso da thread do agendador).")
@@ -0,0 +1,242 @@
+"""Agendador de coletas por máquina e por métrica.
+
+Cada métrica tem o seu intervalo e cada máquina o seu próximo horário de coleta, mantidos em uma fila
+de prioridade. Quando uma máquina fica devida, todas as métricas dela que vencem dentro de batch_window
+segundos são coletadas juntas, em uma única execução remota. Máquinas que falham esperam cada vez mais
+(espera exponencial) e, após breaker_threshold falhas seguidas, o circuito abre: a máquina só é testada
+de novo depois de breaker_cooldown segundos. Métricas cujo valor não muda têm o intervalo esticado aos
+poucos, até max_stretch vezes o intervalo configurado, e voltam ao normal quando mudam.
+Uma coleta que passa de host_deadline é contada como falha na hora, mas continua ocupando a sua vaga
+até a thread terminar, e a máquina só volta à fila depois disso.
+
+O agendador não sabe coletar nem guardar nada: recebe collect(host, cancelled, metrics), que devolve o
+dicionário de métricas (com 'reachable'), e on_result(host, result), chamado na thread do agendador.
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from metrics import ERRORS, SCHEDULE_LAG_SECONDS
+
+
+class _HostState:
+    __slots__ = ('next_due', 'stretch', 'fingerprints', 'failures', 'breaker_open', 'version', 'in_flight')
+
+    def __init__(self, metrics, now):
+        self.next_due = dict.fromkeys(metrics, now)
+        self.stretch = dict.fromkeys(metrics, 1.0)
+        self.fingerprints = {}
+        self.failures = 0
+        self.breaker_open = False
+        self.version = 0
+        self.in_flight = False
+
+
+class AdaptiveScheduler:
+    """Despacha coletas na ordem em que ficam devidas, com no máximo max_parallel em andamento."""
+
+    def __init__(self, executor, collect, on_result, metric_intervals, max_parallel, host_deadline,
+                 batch_window=10, backoff_base=30, backoff_max=600, breaker_threshold=5,
+                 breaker_cooldown=1800, max_stretch=4):
+        self.executor = executor
+        self.collect = collect
+        self.on_result = on_result
+        self.metric_intervals = dict(metric_intervals)
+        self.max_parallel = max_parallel
+        self.host_deadline = host_deadline
+        self.batch_window = batch_window
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_stretch = max_stretch
+        self._hosts = {}
+        self._heap = []  # (horário devido, sequência, host, versão); entradas com versão antiga são ignoradas
+        self._seq = itertools.count()
+        self._in_flight = {}  # future -> (host, métricas, evento de cancelamento); inclui as abandonadas
+        self._abandoned = set()  # futures que passaram do prazo mas cuja thread ainda está rodando
+        self._started = {}  # evento de cancelamento da coleta -> horário em que ela começou a rodar
+        self._started_lock = threading.Lock()
+        self._periodic = []  # [próxima execução, intervalo, função]
+        self._stop = threading.Event()
+
+    # --- configuração ---
+
+    def set_hosts(self, hosts):
+        """Passa a agendar exatamente estas máquinas. Novas máquinas ficam devidas imediatamente."""
+        now = time.monotonic()
+        hosts = set(hosts)
+        running = {host for host, _, _ in self._in_flight.values()}
+        for host in list(self._hosts):
+            if host not in hosts:
+                del self._hosts[host]
+        for host in hosts:
+            if host not in self._hosts:
+                state = self._hosts[host] = _HostState(self.metric_intervals, now)
+                if host in running:
+                    # Coleta anterior ainda rodando: a máquina volta à fila quando ela terminar
+                    state.in_flight = True
+                else:
+                    self._push(host)
+
+    def every(self, interval, func):
+        """Executa func na thread do agendador a cada interval segundos, começando agora."""
+        self._periodic.append([time.monotonic(), interval, func])
+
+    def stop(self):
+        self._stop.set()
+
+    def due_backlog(self):
+        """Máquinas já devidas esperando uma vaga de coleta."""
+        now = time.monotonic()
+        return sum(1 for state in list(self._hosts.values()) if not state.in_flight and min(state.next_due.values()) <= now)
+
+    def stats(self):
+        return {
+            'hosts': len(self._hosts),
+            'in_flight': len(self._in_flight),
+            'abandoned': len(self._abandoned),
+            'backing_off': sum(1 for s in list(self._hosts.values()) if s.failures and not s.breaker_open),
+            'breaker_open': sum(1 for s in list(self._hosts.values()) if s.breaker_open),
+        }
+
+    # --- laço principal ---
+
+    def run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            self._run_periodic(now)
+            self._dispatch(now)
+            if self._in_flight:
+                done, _ = wait(list(self._in_flight), timeout=self._next_wakeup(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish(future)
+            else:
+                self._stop.wait(self._next_wakeup())
+            self._enforce_deadlines()
+
+    def _run_periodic(self, now):
+        for task in self._periodic:
+            if task[0] <= now:
+                task[0] = now + task[1]
+                try:
+                    task[2]()
+                except Exception as e:
+                    print(f"ERRO na tarefa periódica {getattr(task[2], '__name__', task[2])}: {e}")
+
+    def _next_wakeup(self):
+        times = [task[0] for task in self._periodic]
+        if self._heap and len(self._in_flight) < self.max_parallel:
+            times.append(self._heap[0][0])
+        with self._started_lock:
+            times.extend(start + self.host_deadline for start in self._started.values())
+        # Acorda pelo menos a cada segundo para atender stop()
+        return min(max(0.0, min(times) - time.monotonic()), 1.0) if times else 1.0
+
+    def _push(self, host):
+        state = self._hosts[host]
+        state.version += 1
+        heapq.heappush(self._heap, (min(state.next_due.values()), next(self._seq), host, state.version))
+
+    def _dispatch(self, now):
+        while self._heap and self._heap[0][0] <= now and len(self._in_flight) < self.max_parallel:
+            due, _, host, version = heapq.heappop(self._heap)
+            state = self._hosts.get(host)
+            if state is None or state.version != version or state.in_flight:
+                continue
+            SCHEDULE_LAG_SECONDS.observe(now - due)
+            metrics = tuple(m for m, due in state.next_due.items() if due <= now + self.batch_window)
+            cancelled = threading.Event()
+            future = self.executor.submit(self._run_collect, host, metrics, cancelled)
+            self._in_flight[future] = (host, metrics, cancelled)
+            state.in_flight = True
+
+    def _run_collect(self, host, metrics, cancelled):
+        with self._started_lock:
+            self._started[cancelled] = time.monotonic()
+        try:
+            return self.collect(host, cancelled, metrics)
+        finally:
+            with self._started_lock:
+                self._started.pop(cancelled, None)
+
+    def _enforce_deadlines(self):
+        """Marca como falha as coletas que passaram do prazo.
+
+        A thread da coleta não pode ser interrompida: a coleta abandonada continua ocupando a sua vaga
+        em max_parallel, e a máquina não é despachada de novo, até que a thread realmente termine.
+        """
+        now = time.monotonic()
+        for future, (host, metrics, cancelled) in list(self._in_flight.items()):
+            if future in self._abandoned:
+                continue
+            with self._started_lock:
+                started = self._started.get(cancelled)
+            if started is not None and now - started > self.host_deadline:
+                cancelled.set()
+                future.cancel()
+                with self._started_lock:
+                    self._started.pop(cancelled, None)
+                print(f"DEBUG: Prazo de {self.host_deadline}s excedido em {host}; coleta abandonada.")
+                ERRORS.inc(kind='deadline')
+                self._abandoned.add(future)
+                self._record(host, metrics, {})
+
+    def _finish(self, future):
+        host, metrics, _ = self._in_flight.pop(future)
+        if future in self._abandoned:
+            # O resultado já foi contado como falha no prazo; só agora a vaga e a máquina são liberadas
+            self._abandoned.discard(future)
+            state = self._hosts.get(host)
+            if state is not None:
+                state.in_flight = False
+                self._push(host)
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"DEBUG: Falha inesperada na coleta de {host}: {e}")
+            result = {}
+        state = self._hosts.get(host)
+        if state is not None:
+            state.in_flight = False
+        self._record(host, metrics, result)
+        if state is not None:
+            self._push(host)
+
+    def _record(self, host, metrics, result):
+        """Atualiza backoff, circuito e intervalos da máquina e entrega o resultado."""
+        state = self._hosts.get(host)
+        if state is None:
+            return  # Máquina saiu do inventário durante a coleta
+        now = time.monotonic()
+
+        if result.get('reachable'):
+            if state.breaker_open:
+                print(f"Circuito de {host} fechado: máquina voltou a responder.")
+            state.failures = 0
+            state.breaker_open = False
+            for metric in metrics:
+                fingerprint = hash(repr(result.get(metric)))
+                if state.fingerprints.get(metric) == fingerprint:
+                    state.stretch[metric] = min(state.stretch[metric] * 1.5, self.max_stretch)
+                else:
+                    state.stretch[metric] = 1.0
+                state.fingerprints[metric] = fingerprint
+                state.next_due[metric] = now + self.metric_intervals[metric] * state.stretch[metric]
+        else:
+            state.failures += 1
+            if state.failures >= self.breaker_threshold:
+                if not state.breaker_open:
+                    print(f"Circuito de {host} aberto após {state.failures} falhas; nova tentativa em {self.breaker_cooldown}s.")
+                state.breaker_open = True
+                delay = self.breaker_cooldown
+            else:
+                delay = min(self.backoff_base * 2 ** (state.failures - 1), self.backoff_max)
+            state.fingerprints.clear()
+            for metric in state.next_due:
+                state.next_due[metric] = now + delay
+
+        self.on_result(host, result)
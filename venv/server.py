@@ -0,0 +1,380 @@
+import os
+import heapq
+import threading
+import time
+import requests
+import winrm
+from winrm.exceptions import WinRMOperationTimeoutError
+import json
+from datetime import datetime
+import base64
+from collections import namedtuple
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from session_pool import SessionPool, CommandCancelled
+from sinks import Snapshot, SinkPipeline, GoogleSheetSink, CsvSink, JsonLinesSink, SqliteSink
+from history import HistoryStore
+from scheduler import AdaptiveScheduler
+from inventory import Inventory, PowerShellADBackend
+from metrics import (CallbackMetric, SamplingProfiler, start_http_server, ERRORS, PHASE_SECONDS,
+                     HOST_COLLECT_SECONDS, CYCLE_SECONDS, CYCLE_OVERRUNS)
+
+# --- CONFIGURAÇÃO ---
+# CORREÇÃO: Ajustado de "OU-Estacao" para "OU=Estacao"
+AD_OU_DN = "OU=CTI,OU=Fixa,OU=Estacao,OU=Campus Sao Mateus,DC=cefetes,DC=br"
+AD_OUS = [AD_OU_DN]         # Uma OU por laboratório; o nome do laboratório é o primeiro OU= do caminho
+INVENTORY_TTL = 300         # Segundos entre consultas (incrementais) ao AD
+INVENTORY_FULL_REFRESH = 3600   # Segundos entre releituras completas das OUs (detectam máquinas removidas)
+INVENTORY_CACHE_PATH = "inventario.json"
+INVENTORY_EMPTY_READS = 3   # Leituras completas vazias seguidas até uma OU que tinha máquinas ser esvaziada
+ADMIN_USER = 'seu_usuario_admin'
+ADMIN_PASSWORD = 'sua_senha_admin'
+GOOGLE_SHEET_NAME = "Monitoramento de Laboratórios - CTI"
+MONITOR_INTERVAL = 60       # Segundos entre publicações nos destinos e releituras do AD
+MAX_PARALLEL_HOSTS = 32     # Máquinas coletadas simultaneamente
+HOST_DEADLINE = 45          # Tempo máximo (s) de coleta de uma máquina antes de ser abandonada
+WINRM_ENDPOINT = 'http://{host}:5985/wsman'
+WINRM_OPERATION_TIMEOUT = 20  # Também é o maior atraso entre cancelar uma coleta e o comando remoto ser encerrado
+WINRM_READ_TIMEOUT = 30     # Deve ser maior que WINRM_OPERATION_TIMEOUT
+ENABLED_METRICS = ('processes', 'idle_time', 'cpu_usage', 'mem_usage')
+METRIC_INTERVALS = {'cpu_usage': 30, 'mem_usage': 30, 'idle_time': 60, 'processes': 300}  # Segundos entre coletas
+FAILURE_BACKOFF_BASE = 30   # Espera após a primeira falha de uma máquina; dobra a cada falha seguida
+FAILURE_BACKOFF_MAX = 600
+BREAKER_THRESHOLD = 5       # Falhas seguidas que abrem o circuito da máquina
+BREAKER_COOLDOWN = 1800     # Com o circuito aberto, a máquina só é testada de novo após esse tempo (s)
+METRIC_BATCH_WINDOW = 10    # Métricas de uma máquina que vencem dentro desse intervalo (s) são coletadas juntas
+MAX_WINRM_SESSIONS = 512    # Sessões WinRM mantidas abertas entre ciclos; deve cobrir toda a frota
+SESSION_MAX_IDLE = 300      # Sessão sem uso por mais tempo (s) é fechada
+SESSION_MAX_AGE = 3600      # Sessões são renovadas após esse tempo (s), mesmo em uso contínuo
+SESSION_PROBE_AFTER = 60    # Sessão parada por mais tempo (s) é testada antes de ser reaproveitada
+OUTPUT_SINKS = ('google_sheets', 'history')   # Destinos dos dados: 'google_sheets', 'history', 'csv', 'jsonl', 'sqlite'
+CSV_OUTPUT_PATH = "estado_atual.csv"
+JSONL_OUTPUT_PATH = "historico.jsonl"
+SQLITE_OUTPUT_PATH = "monitoramento.db"
+HISTORY_DB_PATH = "historico.db"
+IDLE_THRESHOLD_MIN = 15     # Minutos sem uso a partir dos quais a máquina conta como ociosa no histórico
+METRICS_PORT = 9464         # Porta local das métricas do servidor (formato Prometheus); None desativa
+METRICS_ADDRESS = '127.0.0.1'
+SLOW_HOSTS_REPORTED = 10    # Máquinas mais lentas expostas individualmente nas métricas
+PROFILE_DIR = None          # Se definido, grava ali um perfil de CPU (pilhas agregadas) a cada publicação
+PROFILE_MAX_FILES = 60      # Perfis mantidos em PROFILE_DIR; os mais antigos são apagados
+PUBLISH_QUEUE_SIZE = 2      # Snapshots aguardando gravação; acima disso os mais antigos são descartados
+# --------------------
+
+def _open_winrm_protocol(host):
+    return winrm.Protocol(endpoint=WINRM_ENDPOINT.format(host=host), transport='ntlm', username=ADMIN_USER, password=ADMIN_PASSWORD, server_cert_validation='ignore',
+                          operation_timeout_sec=WINRM_OPERATION_TIMEOUT, read_timeout_sec=WINRM_READ_TIMEOUT)
+
+computer_states = {}
+states_lock = threading.Lock()
+last_collect_seconds = {}  # máquina -> duração (s) da última coleta, para as métricas das mais lentas
+collector_pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL_HOSTS, thread_name_prefix='coletor')
+session_pool = SessionPool(_open_winrm_protocol, max_sessions=MAX_WINRM_SESSIONS, max_idle=SESSION_MAX_IDLE, max_age=SESSION_MAX_AGE,
+                           probe_after=SESSION_PROBE_AFTER)
+# Transporte dos comandos remotos: qualquer objeto com run(host, command) -> (std_out, std_err, status_code).
+# Em produção é o pool de sessões WinRM; benchmark.py o troca por uma frota simulada.
+remote_transport = session_pool
+
+def lab_name_from_dn(ou_dn):
+    return ou_dn.split(',')[0].replace('OU=', '')
+
+def build_sheet_table(computer_states_data, checked_at):
+    """Monta a tabela da planilha (cabeçalho + uma linha por máquina) com diagnóstico de falhas."""
+    headers = [
+        "Laboratório", "Máquina", "Status", "Uso de CPU (%)", "Uso de Memória (%)", 
+        "Horário da Verificação", "Tempo Ocioso", "Observação"
+    ]
+    
+    timestamp = checked_at.strftime("%Y-%m-%d %H:%M:%S")
+    default_lab = lab_name_from_dn(AD_OUS[0])
+
+    rows_to_add = [headers]
+    sorted_computers = sorted(computer_states_data, key=lambda c: (computer_states_data[c].get('lab') or default_lab, c))
+
+    for computer_name in sorted_computers:
+        data = computer_states_data[computer_name]
+        lab_name = data.get('lab') or default_lab
+        observation_list = []
+        
+        cpu_usage = data.get('cpu_usage', 'N/A')
+        if cpu_usage == 'N/A': observation_list.append("CPU")
+
+        mem_usage = data.get('mem_usage', 'N/A')
+        if mem_usage == 'N/A': observation_list.append("Memória")
+        
+        idle_time = data.get('idle_time')
+        if idle_time is None: observation_list.append("Ociosidade")
+
+        if 'processes' in ENABLED_METRICS and not data.get('processes'): observation_list.append("Processos")
+
+        status = 'OK' if not observation_list else 'Parcial'
+        if not data.get('reachable'):
+            status = 'Falha na Coleta'
+            observation = "Conexão falhou."
+        elif observation_list:
+            observation = f"Dados indisponíveis: {', '.join(observation_list)}."
+        else:
+            observation = ''
+
+        idle_time_str = f"{idle_time} min" if isinstance(idle_time, int) else (idle_time or "N/A")
+        
+        row = [
+            lab_name, computer_name, status, str(cpu_usage), str(mem_usage), 
+            timestamp, idle_time_str, observation
+        ]
+        rows_to_add.append(row)
+    
+    return rows_to_add
+
+def build_sinks():
+    available = {
+        'google_sheets': lambda: GoogleSheetSink(GOOGLE_SHEET_NAME, build_sheet_table, credentials_file="credentials.json"),
+        'csv': lambda: CsvSink(CSV_OUTPUT_PATH, build_sheet_table),
+        'jsonl': lambda: JsonLinesSink(JSONL_OUTPUT_PATH),
+        'sqlite': lambda: SqliteSink(SQLITE_OUTPUT_PATH),
+        'history': lambda: HistoryStore(HISTORY_DB_PATH, default_lab=lab_name_from_dn(AD_OUS[0]), idle_threshold=IDLE_THRESHOLD_MIN),
+    }
+    return [available[name]() for name in OUTPUT_SINKS]
+
+def execute_remote_ps(host, script, cancelled=None):
+    """Executa scripts PowerShell remotamente usando Base64 para máxima confiabilidade.
+
+    O comando é enviado pelo remote_transport; em produção, o pool de sessões WinRM, que reaproveita a
+    autenticação e o shell entre ciclos. Se cancelled for marcado, o comando remoto é encerrado e o
+    resultado é None.
+    """
+    try:
+        full_script = f"$ProgressPreference = 'SilentlyContinue'; {script}"
+        encoded_script = base64.b64encode(full_script.encode('utf-16-le')).decode('ascii')
+        
+        with PHASE_SECONDS.time(phase='remote_command'):
+            std_out, std_err, status_code = remote_transport.run(
+                host, f"powershell.exe -EncodedCommand {encoded_script}", cancelled=cancelled)
+
+        if status_code == 0 and std_out:
+            return std_out.decode('utf-8', errors='ignore').strip()
+        else:
+            ERRORS.inc(kind='powershell')
+            error_details = std_err.decode('cp850', errors='ignore').strip()
+            if error_details and not error_details.startswith('#< CLIXML'):
+                print(f"DEBUG: Erro no PowerShell em {host}: {error_details}")
+            return None
+    except CommandCancelled:
+        print(f"DEBUG: Comando em {host} encerrado: coleta cancelada.")
+        return None
+    except Exception as e:
+        ERRORS.inc(kind='timeout' if isinstance(e, (requests.exceptions.Timeout, WinRMOperationTimeoutError)) else 'connection')
+        print(f"DEBUG: Exceção de conexão em {host}: {e}")
+        return None
+
+# Cada métrica é um trecho PowerShell que produz um valor e um parser que o converte para o formato
+# esperado pela planilha. O parser também recebe None quando a métrica falhou ou não veio na resposta.
+MetricProbe = namedtuple('MetricProbe', 'script parse')
+
+def _parse_processes(value):
+    if isinstance(value, dict): return [value]
+    return value if isinstance(value, list) else []
+
+def _parse_idle_time(value):
+    if isinstance(value, int) and not isinstance(value, bool): return value
+    elif value == 'NoActiveSession': return "Nenhum usuário logado"
+    else: return None
+
+def _parse_percent(value):
+    return value if isinstance(value, int) and not isinstance(value, bool) else "N/A"
+
+METRIC_PROBES = {
+    'processes': MetricProbe(
+        "@(Get-Process -IncludeUserName | Select-Object Id, ProcessName, UserName)",
+        _parse_processes),
+    'idle_time': MetricProbe("""
+        $session = Get-CimInstance -ClassName Win32_TSSession | Where-Object { $_.State -eq 'Active' }
+        if ($session) { [int][math]::Floor(($session | Measure-Object -Property IdleTime -Minimum).Minimum / 60000) }
+        else { 'NoActiveSession' }
+        """, _parse_idle_time),
+    'cpu_usage': MetricProbe("""
+        $counter = (Get-Counter -Counter '\\Processor(_Total)\\% Processor Time').CounterSamples.CookedValue
+        Start-Sleep -Milliseconds 500
+        $counter = (Get-Counter -Counter '\\Processor(_Total)\\% Processor Time').CounterSamples.CookedValue
+        [int]$counter
+        """, _parse_percent),
+    'mem_usage': MetricProbe(
+        "[int]((Get-Counter -Counter '\\Memory\\% Committed Bytes In Use').CounterSamples.CookedValue)",
+        _parse_percent),
+}
+
+@lru_cache(maxsize=None)
+def build_probe_script(metrics):
+    """Monta um único script que coleta todas as métricas pedidas e devolve um documento JSON.
+
+    Cada métrica roda no seu próprio try/catch, então a falha de uma vira null sem afetar as demais.
+    """
+    parts = ["$ErrorActionPreference = 'Stop'", "$r = [ordered]@{}"]
+    for name in metrics:
+        parts.append(f"try {{ $r['{name}'] = & {{ {METRIC_PROBES[name].script} }} }} catch {{ $r['{name}'] = $null }}")
+    parts.append("ConvertTo-Json -InputObject $r -Depth 4 -Compress")
+    return '\n'.join(parts)
+
+def get_remote_metrics(host, metrics=ENABLED_METRICS, cancelled=None):
+    """Coleta as métricas pedidas com uma única execução remota do PowerShell.
+
+    Sempre devolve todas as métricas pedidas, com o valor de falha de cada uma ('N/A', None, [])
+    quando não puderam ser obtidas, e a chave 'reachable' indicando se a máquina respondeu.
+    """
+    metrics = tuple(metrics)
+    result = execute_remote_ps(host, build_probe_script(metrics), cancelled)
+    document = None
+    if result:
+        try:
+            with PHASE_SECONDS.time(phase='json_parse'):
+                document = json.loads(result)
+        except ValueError as e:
+            ERRORS.inc(kind='parse')
+            print(f"DEBUG: Resposta inválida de {host}: {e}")
+    if not isinstance(document, dict):
+        document = None
+
+    state = {name: METRIC_PROBES[name].parse(document.get(name) if document else None) for name in metrics}
+    state['reachable'] = document is not None
+    return state
+
+def collect_host(computer, cancelled, metrics=ENABLED_METRICS):
+    """Coleta as métricas de uma máquina. Marcar cancelled encerra o comando remoto em andamento."""
+    if cancelled.is_set():
+        return {}
+    print(f"Coletando dados de {computer} ({', '.join(metrics)})...")
+    start = time.perf_counter()
+    try:
+        return get_remote_metrics(computer, metrics, cancelled)
+    finally:
+        elapsed = time.perf_counter() - start
+        HOST_COLLECT_SECONDS.observe(elapsed)
+        last_collect_seconds[computer] = elapsed
+
+def store_result(computer, result):
+    """Atualiza o estado da máquina com as métricas recém-coletadas.
+
+    Métricas não coletadas nesta rodada mantêm o valor anterior. Se a máquina não respondeu, o estado
+    anterior é descartado para que ela apareça como falha. O estado de cada máquina é substituído, nunca
+    alterado, então uma cópia rasa de computer_states é um snapshot consistente.
+    """
+    lab = target_labs.get(computer)
+    with states_lock:
+        if result.get('reachable'):
+            computer_states[computer] = {**computer_states.get(computer, {}), **result, 'lab': lab}
+        else:
+            computer_states[computer] = {'reachable': False, 'lab': lab}
+
+def refresh_targets():
+    """Sincroniza o agendador com o último inventário válido (lido do cache, sem esperar pelo AD)."""
+    global target_labs
+    target_labs = inventory.hosts()
+    if not target_labs:
+        # Inventário vazio só depois de leituras completas vazias seguidas (ver Inventory); segue
+        # sincronizando para que as máquinas saiam do agendador e da planilha
+        print("Nenhum computador encontrado. Verifique o caminho da OU e a conexão com o AD.")
+    if len(target_labs) > MAX_WINRM_SESSIONS:
+        print(f"AVISO: {len(target_labs)} máquinas e MAX_WINRM_SESSIONS = {MAX_WINRM_SESSIONS}; "
+              "as excedentes abrirão uma sessão WinRM nova a cada coleta.")
+    scheduler.set_hosts(target_labs)
+    with states_lock:
+        for computer in set(computer_states) - set(target_labs):
+            del computer_states[computer]
+    for computer in set(last_collect_seconds) - set(target_labs):
+        last_collect_seconds.pop(computer, None)
+
+def slowest_hosts():
+    """Duração (s) da última coleta das SLOW_HOSTS_REPORTED máquinas mais lentas: {máquina: segundos}."""
+    return dict(heapq.nlargest(SLOW_HOSTS_REPORTED, list(last_collect_seconds.items()), key=lambda item: item[1]))
+
+last_publish = None
+published_hosts = False  # Algum snapshot com máquinas já foi publicado desde o início do servidor
+
+def publish_states():
+    global last_publish, published_hosts
+    now = time.monotonic()
+    if last_publish is not None:
+        CYCLE_SECONDS.observe(now - last_publish)
+        if now - last_publish > MONITOR_INTERVAL + 1:
+            CYCLE_OVERRUNS.inc()
+    last_publish = now
+
+    with PHASE_SECONDS.time(phase='publish'):
+        with states_lock:
+            snapshot = Snapshot(datetime.now(), dict(computer_states))
+        # Antes da primeira coleta não há o que publicar (e publicar vazio apagaria a planilha). Depois
+        # dela, um estado vazio significa que o inventário ficou vazio e também é publicado.
+        if snapshot.states or published_hosts:
+            publisher.publish(snapshot)
+            published_hosts = True
+    session_pool.evict_idle()
+    if profiler:
+        profiler.dump(os.path.join(PROFILE_DIR, f"ciclo-{snapshot.taken_at:%Y%m%d-%H%M%S}.folded"))
+    print(f"Agendador: {scheduler.stats()} | Sessões WinRM: {session_pool.stats()} | Snapshots descartados: {publisher.dropped}")
+
+target_labs = {}  # máquina -> laboratório, conforme o inventário
+inventory = Inventory(PowerShellADBackend(), {ou: lab_name_from_dn(ou) for ou in AD_OUS}, ttl=INVENTORY_TTL,
+                      full_refresh_interval=INVENTORY_FULL_REFRESH, cache_path=INVENTORY_CACHE_PATH,
+                      empty_reads_to_accept=INVENTORY_EMPTY_READS)
+publisher = None  # Criado em monitor_loop, para que importar o módulo não abra arquivos nem conexões
+profiler = None
+
+def build_scheduler(executor, collect, on_result, max_parallel=MAX_PARALLEL_HOSTS, time_scale=1.0):
+    """Cria o agendador com a configuração acima. time_scale multiplica todos os tempos; benchmark.py o
+    usa para simular muitos ciclos em pouco tempo."""
+    return AdaptiveScheduler(
+        executor, collect, on_result,
+        metric_intervals={m: METRIC_INTERVALS[m] * time_scale for m in ENABLED_METRICS},
+        max_parallel=max_parallel, host_deadline=HOST_DEADLINE * time_scale,
+        batch_window=METRIC_BATCH_WINDOW * time_scale,
+        backoff_base=FAILURE_BACKOFF_BASE * time_scale, backoff_max=FAILURE_BACKOFF_MAX * time_scale,
+        breaker_threshold=BREAKER_THRESHOLD, breaker_cooldown=BREAKER_COOLDOWN * time_scale)
+
+scheduler = build_scheduler(collector_pool, collect_host, store_result)
+
+def register_collector_metrics():
+    """Expõe como métricas os contadores e filas que já existem nos componentes do servidor."""
+    CallbackMetric('idlewatch_hosts', "Máquinas no inventário.", lambda: len(target_labs))
+    CallbackMetric('idlewatch_publish_queue_depth', "Snapshots aguardando gravação.", publisher.pending)
+    CallbackMetric('idlewatch_publish_dropped_total', "Snapshots descartados por atraso da gravação.",
+                   lambda: publisher.dropped, kind='counter')
+    CallbackMetric('idlewatch_collections_in_flight', "Coletas em andamento.", lambda: scheduler.stats()['in_flight'])
+    CallbackMetric('idlewatch_collections_abandoned', "Coletas que passaram do prazo e ainda ocupam uma vaga.",
+                   lambda: scheduler.stats()['abandoned'])
+    CallbackMetric('idlewatch_slowest_hosts_seconds', f"Duração da última coleta das {SLOW_HOSTS_REPORTED} máquinas mais lentas.",
+                   slowest_hosts, labelname='host')
+    CallbackMetric('idlewatch_collections_due', "Máquinas devidas aguardando uma vaga de coleta.", scheduler.due_backlog)
+    CallbackMetric('idlewatch_hosts_backoff', "Máquinas por situação de falha.",
+                   lambda: {k: v for k, v in scheduler.stats().items() if k in ('backing_off', 'breaker_open')},
+                   labelname='state')
+    CallbackMetric('idlewatch_winrm_sessions_total', "Eventos do pool de sessões WinRM.",
+                   lambda: {k: v for k, v in session_pool.stats().items() if k not in ('open', 'idle')},
+                   kind='counter', labelname='event')
+    CallbackMetric('idlewatch_winrm_sessions_open', "Sessões WinRM abertas.", lambda: session_pool.stats()['open'])
+
+# Loop principal
+def monitor_loop():
+    """Coleta cada máquina quando as suas métricas vencem e publica o estado a cada MONITOR_INTERVAL."""
+    global publisher, profiler
+    publisher = SinkPipeline(build_sinks(), max_pending=PUBLISH_QUEUE_SIZE)
+    publisher.start()
+    if METRICS_PORT:
+        register_collector_metrics()
+        start_http_server(METRICS_PORT, METRICS_ADDRESS)
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler = SamplingProfiler(max_files=PROFILE_MAX_FILES)
+        profiler.start()
+    inventory.start()
+    scheduler.every(MONITOR_INTERVAL, refresh_targets)
+    scheduler.every(MONITOR_INTERVAL, publish_states)
+    scheduler.run()
+
+if __name__ == '__main__':
+    try:
+        monitor_loop()
+    finally:
+        inventory.stop()
+        if publisher:
+            publisher.stop(timeout=30)
+        session_pool.close_all()
\ No newline at end of file
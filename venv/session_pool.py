@@ -0,0 +1,220 @@
+"""Pool de sessões WinRM reaproveitadas entre ciclos de monitoramento.
+
+Abrir um winrm.Protocol custa um handshake NTLM e abrir um shell remoto custa mais uma ida e volta.
+O pool mantém, por máquina, um protocolo já autenticado com o shell aberto, de modo que cada coleta
+paga apenas a execução do comando. Sessões ociosas ou antigas demais são descartadas e o total de
+sessões guardadas é limitado: atingido o limite, as máquinas excedentes usam sessões avulsas, abertas e
+fechadas a cada comando, em vez de expulsar as sessões de outras máquinas (o que, numa frota maior que o
+limite, faria nenhuma sessão ser reaproveitada). Uma sessão parada por mais de probe_after segundos é testada com um comando
+vazio antes de ser reaproveitada (a máquina pode ter reiniciado nesse meio tempo); se o teste falhar,
+ela é trocada por uma nova sem gastar o comando real. Se mesmo assim o comando falhar numa sessão
+reaproveitada, ela é reaberta e o comando é repetido uma vez.
+
+Um comando pode ser cancelado por um threading.Event: a saída é lida em chamadas Receive de até
+operation_timeout_sec segundos e, entre elas, o evento é verificado; se estiver marcado, o comando
+remoto é encerrado (Signal terminate) e run() levanta CommandCancelled. O tempo até o cancelamento ter
+efeito é, portanto, limitado pelo operation_timeout_sec do protocolo.
+
+O pool não cria protocolos por conta própria: recebe uma função host -> protocolo, o que permite
+apontá-lo para um endpoint WS-Man falso local nos testes.
+"""
+import threading
+import time
+
+import requests
+from winrm.exceptions import WinRMOperationTimeoutError
+
+from metrics import PHASE_SECONDS
+
+
+class CommandCancelled(Exception):
+    """O comando remoto foi encerrado porque a coleta foi cancelada."""
+
+
+class WinRMSession:
+    """Um protocolo autenticado e um shell aberto em uma máquina."""
+
+    def __init__(self, host, protocol):
+        self.host = host
+        self.protocol = protocol
+        self.shell_id = protocol.open_shell()
+        self.created = self.last_used = time.monotonic()
+
+    def run(self, command, args=(), cancelled=None):
+        if cancelled is not None and cancelled.is_set():
+            raise CommandCancelled(f"coleta de {self.host} cancelada")
+        command_id = self.protocol.run_command(self.shell_id, command, args)
+        try:
+            std_out, std_err, done = [], [], False
+            while not done:
+                if cancelled is not None and cancelled.is_set():
+                    raise CommandCancelled(f"coleta de {self.host} cancelada")
+                try:
+                    out, err, status_code, done = self.protocol.get_command_output_raw(self.shell_id, command_id)
+                except WinRMOperationTimeoutError:
+                    continue  # Comando ainda rodando: nenhuma saída dentro do operation_timeout_sec
+                std_out.append(out)
+                std_err.append(err)
+            return b''.join(std_out), b''.join(std_err), status_code
+        finally:
+            # Também encerra o comando remoto quando a leitura foi interrompida
+            try:
+                self.protocol.cleanup_command(self.shell_id, command_id)
+            except Exception:
+                pass
+            self.last_used = time.monotonic()
+
+    def is_alive(self):
+        """Executa um comando vazio no shell e confirma que a sessão ainda vale.
+
+        Lê a saída com uma única chamada Receive: se o comando não terminar dentro do
+        operation_timeout_sec, a sessão é considerada morta, em vez de o teste esperar indefinidamente.
+        """
+        try:
+            command_id = self.protocol.run_command(self.shell_id, 'cmd.exe', ('/c', 'exit 0'))
+            try:
+                _, _, status_code, done = self.protocol.get_command_output_raw(self.shell_id, command_id)
+            finally:
+                try:
+                    self.protocol.cleanup_command(self.shell_id, command_id)
+                except Exception:
+                    pass
+        except Exception:
+            return False
+        if done and status_code == 0:
+            self.last_used = time.monotonic()
+            return True
+        return False
+
+    def close(self):
+        try:
+            self.protocol.close_shell(self.shell_id)
+        except Exception:
+            pass
+
+
+class SessionPool:
+    """Guarda no máximo uma sessão ociosa por máquina e no máximo max_sessions sessões ociosas no total.
+
+    max_sessions deve ser pelo menos o tamanho da frota; acima disso, as máquinas que não couberem
+    pagam a abertura da sessão a cada comando (contadas em 'overflow').
+
+    Cada sessão é usada por uma única thread por vez: run() a retira do pool durante o comando e a
+    devolve ao final. Se uma sessão reaproveitada falhar, ela é fechada e o comando é repetido uma
+    vez em uma sessão nova; timeouts e comandos cancelados não são repetidos.
+    """
+
+    def __init__(self, protocol_factory, max_sessions=512, max_idle=300, max_age=3600, probe_after=60):
+        self.protocol_factory = protocol_factory
+        self.max_sessions = max_sessions
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.probe_after = probe_after
+        self._idle = {}  # host -> WinRMSession
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'reconnects': 0, 'evictions': 0, 'overflow': 0,
+                          'probes': 0, 'probe_failures': 0}
+
+    def run(self, host, command, args=(), cancelled=None):
+        """Executa o comando na máquina e devolve (std_out, std_err, status_code).
+
+        Se cancelled for marcado durante a execução, o comando remoto é encerrado e CommandCancelled é
+        levantada.
+        """
+        session = self._checkout(host)
+        reused = session is not None
+        try:
+            if session is None:
+                session = self._open(host)
+            try:
+                result = session.run(command, args, cancelled)
+            except (requests.exceptions.Timeout, CommandCancelled):
+                raise
+            except Exception:
+                if not reused or (cancelled is not None and cancelled.is_set()):
+                    raise
+                session.close()
+                session = None
+                self._count('reconnects')
+                session = self._open(host)
+                result = session.run(command, args, cancelled)
+        except CommandCancelled:
+            # O comando foi encerrado, mas o shell continua válido e volta ao pool
+            self._release(session)
+            raise
+        except Exception:
+            if session is not None:
+                session.close()
+            self._release(None)
+            raise
+        self._release(session)
+        return result
+
+    def evict_idle(self):
+        """Fecha as sessões ociosas que passaram de max_idle ou max_age. Chamado a cada ciclo."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [s for s in self._idle.values() if not self._is_fresh(s, now)]
+            for session in expired:
+                del self._idle[session.host]
+            self._counters['evictions'] += len(expired)
+        for session in expired:
+            session.close()
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._idle.values())
+            self._idle.clear()
+        for session in sessions:
+            session.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, open=len(self._idle) + self._in_use, idle=len(self._idle))
+
+    def _is_fresh(self, session, now):
+        return now - session.last_used <= self.max_idle and now - session.created <= self.max_age
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _checkout(self, host):
+        """Retira a sessão ociosa da máquina, se houver uma ainda válida. Reserva a vaga em uso."""
+        stale = None
+        with self._lock:
+            self._in_use += 1
+            session = self._idle.pop(host, None)
+            if session is not None and not self._is_fresh(session, time.monotonic()):
+                stale, session = session, None
+                self._counters['evictions'] += 1
+        if stale is not None:
+            stale.close()
+        if session is not None and time.monotonic() - session.last_used > self.probe_after:
+            self._count('probes')
+            if not session.is_alive():
+                self._count('probe_failures')
+                session.close()
+                session = None
+        self._count('hits' if session is not None else 'misses')
+        return session
+
+    def _open(self, host):
+        """Abre uma sessão nova. Nenhuma sessão de outra máquina é fechada para abrir espaço."""
+        with PHASE_SECONDS.time(phase='winrm_connect'):
+            return WinRMSession(host, self.protocol_factory(host))
+
+    def _release(self, session):
+        """Devolve a sessão ao pool, ou a fecha se a máquina já tem outra ociosa ou o pool está cheio."""
+        extra = None
+        with self._lock:
+            self._in_use -= 1
+            if session is not None:
+                if session.host in self._idle or len(self._idle) >= self.max_sessions:
+                    extra = session
+                    self._counters['overflow'] += 1
+                else:
+                    self._idle[session.host] = session
+        if extra is not None:
+            extra.close()
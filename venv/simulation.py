@@ -0,0 +1,149 @@
+"""Frota simulada de máquinas Windows e planilha em memória, para medir o servidor sem rede.
+
+SimulatedFleet substitui o transporte WinRM (ver server.remote_transport): responde aos scripts de
+coleta com o mesmo documento JSON que o PowerShell remoto devolveria, depois de uma latência sorteada
+de uma distribuição log-normal, e falha ou estoura o tempo nas taxas configuradas. MemoryWorksheet
+substitui a aba do Google Sheets (ver GoogleSheetSink.open_worksheet) e conta as chamadas à API.
+"""
+import base64
+import json
+import random
+import re
+import threading
+import time
+
+import requests
+
+from session_pool import CommandCancelled
+
+_METRIC_RE = re.compile(r"\$r\['(\w+)'\] = ")
+_PROCESS_NAMES = ('svchost', 'explorer', 'chrome', 'code', 'python', 'java', 'eclipse', 'Teams',
+                  'OneDrive', 'MsMpEng', 'RuntimeBroker', 'SearchHost', 'dwm', 'csrss', 'lsass')
+
+
+class SimulatedTimeout(requests.exceptions.Timeout):
+    pass
+
+
+class SimulatedConnectionError(Exception):
+    pass
+
+
+class SimulatedFleet:
+    """Transporte com a mesma interface de SessionPool.run: run(host, command, cancelled=None) ->
+    (std_out, std_err, status_code). Marcar cancelled interrompe a espera simulada com CommandCancelled.
+
+    Latências e o timeout são multiplicados por time_scale, o que permite simular frotas grandes em
+    pouco tempo (ex.: time_scale=0.1 roda dez vezes mais rápido que o real).
+    """
+
+    def __init__(self, size, latency_median=0.8, latency_sigma=0.5, failure_rate=0.02, timeout_rate=0.01,
+                 timeout=30, process_count=(80, 250), user_rate=0.6, time_scale=1.0, seed=0):
+        self.hosts = [f"LAB-PC{i:04d}" for i in range(1, size + 1)]
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+        self.time_scale = time_scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._machines = {}
+        for host in self.hosts:
+            user = f"CEFETES\\aluno{self._rng.randint(1, 9999)}" if self._rng.random() < user_rate else None
+            self._machines[host] = {
+                'user': user,
+                'process_count': self._rng.randint(*process_count),
+                'idle': self._rng.randint(0, 240) if user else 'NoActiveSession',
+            }
+        self.calls = 0
+
+    def run(self, host, command, args=(), cancelled=None):
+        with self._lock:
+            self.calls += 1
+            roll = self._rng.random()
+            latency = self._rng.lognormvariate(0, self.latency_sigma) * self.latency_median
+            seed = self._rng.random()
+        machine = self._machines.get(host)
+
+        if machine is None or roll < self.timeout_rate:
+            self._wait(self.timeout * self.time_scale, host, cancelled)
+            raise SimulatedTimeout(f"Tempo esgotado ao conectar em {host} (simulado)")
+        if roll < self.timeout_rate + self.failure_rate:
+            self._wait(min(latency, 1.0) * self.time_scale, host, cancelled)
+            raise SimulatedConnectionError(f"Conexão recusada por {host} (simulado)")
+
+        self._wait(latency * self.time_scale, host, cancelled)
+        metrics = _METRIC_RE.findall(self._decode(command))
+        document = {name: self._metric(machine, name, random.Random(seed)) for name in metrics}
+        return json.dumps(document, separators=(',', ':')).encode('utf-8'), b'', 0
+
+    @staticmethod
+    def _wait(seconds, host, cancelled):
+        if cancelled is None:
+            time.sleep(seconds)
+        elif cancelled.wait(seconds):
+            raise CommandCancelled(f"coleta de {host} cancelada")
+
+    @staticmethod
+    def _decode(command):
+        encoded = command.rsplit(' ', 1)[-1]
+        return base64.b64decode(encoded).decode('utf-16-le')
+
+    @staticmethod
+    def _metric(machine, name, rng):
+        if name == 'cpu_usage':
+            return rng.randint(0, 100)
+        if name == 'mem_usage':
+            return rng.randint(20, 95)
+        if name == 'idle_time':
+            return machine['idle']
+        if name == 'processes':
+            count = machine['process_count'] + rng.randint(-5, 5)
+            return [{'Id': 4 * i + 4, 'ProcessName': _PROCESS_NAMES[i % len(_PROCESS_NAMES)],
+                     'UserName': machine['user'] if i % 3 else 'NT AUTHORITY\\SYSTEM'}
+                    for i in range(max(count, 1))]
+        return None
+
+
+class MemoryWorksheet:
+    """Aba de planilha em memória com a parte da API do gspread usada por GoogleSheetSink."""
+
+    def __init__(self, row_count=1000):
+        self.row_count = row_count
+        self.cells = {}  # (linha, coluna) a partir de 0 -> valor
+        self.api_calls = 0
+        self.cells_written = 0
+
+    def get_all_values(self):
+        self.api_calls += 1
+        if not self.cells:
+            return []
+        rows = max(r for r, _ in self.cells) + 1
+        cols = max(c for _, c in self.cells) + 1
+        return [[self.cells.get((r, c), '') for c in range(cols)] for r in range(rows)]
+
+    def add_rows(self, rows):
+        self.api_calls += 1
+        self.row_count += rows
+
+    def batch_update(self, data, value_input_option=None):
+        self.api_calls += 1
+        for update in data:
+            start = update['range'].split(':')[0]
+            row, col = _parse_a1(start)
+            for r, values in enumerate(update['values']):
+                for c, value in enumerate(values):
+                    self.cells_written += 1
+                    if value == '':
+                        self.cells.pop((row + r, col + c), None)
+                    else:
+                        self.cells[(row + r, col + c)] = value
+
+
+def _parse_a1(label):
+    letters = label.rstrip('0123456789')
+    col = 0
+    for ch in letters:
+        col = col * 26 + ord(ch) - 64
+    return int(label[len(letters):]) - 1, col - 1
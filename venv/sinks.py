@@ -0,0 +1,313 @@
+"""Destinos de saída dos dados coletados e o publicador que os alimenta em segundo plano.
+
+Todo destino (sink) expõe um atributo name e um método write(snapshot). O SinkPipeline recebe os
+snapshots do coletor por uma fila limitada e os grava em todos os destinos numa thread própria, de modo
+que um destino lento ou fora do ar não atrasa a coleta.
+"""
+import csv
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+
+import gspread
+
+from metrics import ERRORS, PHASE_SECONDS
+
+# Estado de todas as máquinas em um instante: taken_at é um datetime, states o dicionário
+# computador -> métricas. O dicionário não deve ser alterado depois de publicado.
+Snapshot = namedtuple('Snapshot', 'taken_at states')
+
+
+def _a1(row, col):
+    """Converte linha/coluna (a partir de 1) para a notação A1 da planilha."""
+    label = ''
+    while col:
+        col, rem = divmod(col - 1, 26)
+        label = chr(65 + rem) + label
+    return f"{label}{row}"
+
+
+class TableDiffer(ABC):
+    """Interface do motor de diferenças: compara duas tabelas (listas de linhas) e devolve as
+    atualizações no formato aceito por Worksheet.batch_update: [{'range': 'A1:B2', 'values': [...]}].
+    """
+
+    @abstractmethod
+    def diff(self, old, new):
+        ...
+
+
+class CellRunDiffer(TableDiffer):
+    """Envia apenas as células alteradas.
+
+    Em cada linha, células alteradas consecutivas formam um trecho; trechos com as mesmas colunas em
+    linhas consecutivas são unidos em um só retângulo (ex.: a coluna de horário inteira vira um range).
+    Células que existiam na tabela antiga e não existem na nova são apagadas com ''.
+    """
+
+    def diff(self, old, new):
+        blocks = []
+        open_blocks = {}  # (primeira coluna, última coluna) -> bloco ainda aberto na linha anterior
+        for r in range(max(len(old), len(new))):
+            old_row = old[r] if r < len(old) else []
+            new_row = new[r] if r < len(new) else []
+            width = max(len(old_row), len(new_row))
+            old_row = [str(v) for v in old_row] + [''] * (width - len(old_row))
+            new_row = [str(v) for v in new_row] + [''] * (width - len(new_row))
+
+            still_open = {}
+            for first, last in self._changed_runs(old_row, new_row):
+                block = open_blocks.get((first, last))
+                if block is None:
+                    block = {'row': r, 'first': first, 'last': last, 'values': []}
+                    blocks.append(block)
+                block['values'].append(new_row[first:last + 1])
+                still_open[(first, last)] = block
+            open_blocks = still_open
+
+        return [{
+            'range': f"{_a1(b['row'] + 1, b['first'] + 1)}:{_a1(b['row'] + len(b['values']), b['last'] + 1)}",
+            'values': b['values'],
+        } for b in blocks]
+
+    @staticmethod
+    def _changed_runs(old_row, new_row):
+        first = None
+        for c, (a, b) in enumerate(zip(old_row, new_row)):
+            if a != b and first is None:
+                first = c
+            elif a == b and first is not None:
+                yield first, c - 1
+                first = None
+        if first is not None:
+            yield first, len(new_row) - 1
+
+
+class GoogleSheetSink:
+    """Mantém a planilha igual à última tabela escrita, enviando só as diferenças.
+
+    build_table converte (states, taken_at) na tabela da planilha. O cliente e a aba ficam em cache
+    entre ciclos. Na primeira escrita (ou após um erro) o conteúdo atual da aba é lido como ponto de
+    partida, então a planilha nunca é limpa nem fica vazia. open_worksheet pode ser substituído por uma
+    função que devolve uma aba falsa em memória.
+    """
+    name = 'google_sheets'
+
+    def __init__(self, sheet_name, build_table, credentials_file='credentials.json', differ=None, open_worksheet=None):
+        self.sheet_name = sheet_name
+        self.build_table = build_table
+        self.credentials_file = credentials_file
+        self.differ = differ or CellRunDiffer()
+        self.open_worksheet = open_worksheet or self._open_google_worksheet
+        self._worksheet = None
+        self._last_table = None
+
+    def _open_google_worksheet(self):
+        print(f"Autenticando e conectando à planilha '{self.sheet_name}'...")
+        gc = gspread.service_account(filename=self.credentials_file)
+        return gc.open(self.sheet_name).get_worksheet(0)
+
+    def write(self, snapshot):
+        changed = self.write_table(self.build_table(snapshot.states, snapshot.taken_at))
+        print(f"Planilha atualizada com os dados de {len(snapshot.states)} máquinas ({changed} células alteradas).")
+
+    def write_table(self, table):
+        """Atualiza a planilha para refletir a tabela e devolve quantas células foram enviadas."""
+        table = [[str(v) for v in row] for row in table]
+        try:
+            if self._worksheet is None:
+                self._worksheet = self.open_worksheet()
+                self._last_table = self._worksheet.get_all_values()
+
+            updates = self.differ.diff(self._last_table, table)
+            if updates:
+                rows_needed = len(table) - self._worksheet.row_count
+                if rows_needed > 0:
+                    self._worksheet.add_rows(rows_needed)
+                self._worksheet.batch_update(updates, value_input_option='USER_ENTERED')
+            self._last_table = table
+        except Exception:
+            # Estado da planilha desconhecido: reconecta e relê tudo na próxima escrita
+            self._worksheet = None
+            self._last_table = None
+            raise
+        return sum(len(row) for u in updates for row in u['values'])
+
+
+class CsvSink:
+    """Grava a tabela atual (as mesmas colunas da planilha) em um arquivo CSV, substituído a cada snapshot."""
+    name = 'csv'
+
+    def __init__(self, path, build_table):
+        self.path = path
+        self.build_table = build_table
+
+    def write(self, snapshot):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(self.build_table(snapshot.states, snapshot.taken_at))
+        os.replace(tmp_path, self.path)
+
+
+class JsonLinesSink:
+    """Acrescenta uma linha JSON por máquina a cada snapshot. A lista de processos é resumida à contagem,
+    a menos que include_processes seja verdadeiro."""
+    name = 'jsonl'
+
+    def __init__(self, path, include_processes=False):
+        self.path = path
+        self.include_processes = include_processes
+
+    def write(self, snapshot):
+        timestamp = snapshot.taken_at.isoformat(timespec='seconds')
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for computer, data in sorted(snapshot.states.items()):
+                record = {'timestamp': timestamp, 'computer': computer}
+                record.update((k, v) for k, v in data.items() if k != 'processes')
+                processes = data.get('processes') or []
+                if self.include_processes:
+                    record['processes'] = processes
+                else:
+                    record['process_count'] = len(processes)
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class SqliteSink:
+    """Mantém em um banco SQLite uma tabela com o estado atual de cada máquina.
+
+    A conexão é aberta na primeira escrita, ou seja, na thread do publicador, que é a única a usá-la.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("""CREATE TABLE IF NOT EXISTS computer_states (
+            computer TEXT PRIMARY KEY, checked_at TEXT, reachable INTEGER,
+            cpu_usage, mem_usage, idle_time, processes TEXT)""")
+        return conn
+
+    def write(self, snapshot):
+        if self._conn is None:
+            self._conn = self._connect()
+        checked_at = snapshot.taken_at.isoformat(timespec='seconds')
+        rows = [(computer, checked_at, int(bool(data.get('reachable'))), data.get('cpu_usage'),
+                 data.get('mem_usage'), data.get('idle_time'), json.dumps(data.get('processes') or [], ensure_ascii=False))
+                for computer, data in snapshot.states.items()]
+        with self._conn:
+            self._conn.execute("DELETE FROM computer_states")
+            self._conn.executemany("INSERT INTO computer_states VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+_STOP = object()
+
+
+class SinkPipeline:
+    """Publica snapshots em vários destinos a partir de uma thread de escrita em segundo plano.
+
+    publish() nunca bloqueia o coletor: a fila guarda no máximo max_pending snapshots e, quando está
+    cheia, o mais antigo é descartado. A thread de escrita sempre grava o snapshot mais recente
+    disponível (os intermediários são descartados). Falhas de um destino são repetidas com espera
+    exponencial, mas a repetição é abandonada assim que há um snapshot mais novo na fila. stop() não
+    interrompe as repetições: o snapshot em gravação é concluído antes de a thread terminar.
+    """
+
+    def __init__(self, sinks, max_pending=2, max_retries=5, retry_backoff=2, max_backoff=60):
+        self.sinks = list(sinks)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.dropped = 0  # Alterado pelo coletor e pela thread de escrita; sempre sob _dropped_lock
+        self._dropped_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._newer = threading.Event()  # Só acorda a espera entre tentativas; quem decide é a fila
+        self._thread = threading.Thread(target=self._run, name='publicador', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Grava o último snapshot pendente e encerra a thread de escrita."""
+        self._put(_STOP)
+        self._thread.join(timeout)
+
+    def publish(self, snapshot):
+        self._put(snapshot)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                break
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._count_dropped(1)
+                except queue.Empty:
+                    pass
+        self._newer.set()
+
+    def _count_dropped(self, count):
+        with self._dropped_lock:
+            self.dropped += count
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            snapshots = [item for item in items if item is not _STOP]
+            self._count_dropped(max(0, len(snapshots) - 1))
+            if snapshots:
+                for sink in self.sinks:
+                    self._write_with_retry(sink, snapshots[-1])
+            if len(snapshots) < len(items):
+                return
+
+    def _write_with_retry(self, sink, snapshot):
+        delay = self.retry_backoff
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                with PHASE_SECONDS.time(phase=f'sink_{sink.name}'):
+                    sink.write(snapshot)
+                return
+            except Exception as e:
+                ERRORS.inc(kind='sink')
+                print(f"ERRO ao gravar no destino '{sink.name}' (tentativa {attempt}/{self.max_retries}): {e}")
+            if attempt == self.max_retries:
+                return
+            if self._wait_for_newer(delay):
+                print(f"Snapshot mais recente disponível; '{sink.name}' será atualizado com ele.")
+                return
+            delay = min(delay * 2, self.max_backoff)
+
+    def _newer_pending(self):
+        """Há um snapshot (não apenas o pedido de parada) aguardando na fila."""
+        with self._queue.mutex:
+            return any(item is not _STOP for item in self._queue.queue)
+
+    def _wait_for_newer(self, timeout):
+        """Espera até timeout segundos; devolve True assim que houver um snapshot mais novo na fila."""
+        deadline = time.monotonic() + timeout
+        while not self._newer_pending():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._newer.wait(remaining)
+            # Limpa antes de consultar a fila de novo: um _put() posterior volta a marcar o evento
+            self._newer.clear()
+        return True